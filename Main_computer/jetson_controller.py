@@ -1,191 +1,373 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext, filedialog
-import socket
+import asyncio
+import functools
+import itertools
 import json
+import random
 import threading
 import time
-import base64
 import numpy as np
 from PIL import Image, ImageTk
 import configparser
 import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_HEADER = struct.Struct('!QII'); DOWNLOAD_MAX_RETRIES = 5; DOWNLOAD_RETRY_DELAY = 3
+STREAM_HEADER = struct.Struct('!I'); CONNECT_TIMEOUT = 5; COMMAND_TIMEOUT = 10; STREAM_TIMEOUT = 15
+# 재연결은 1초부터 두 배씩 최대 30초까지 (수십 대가 동시에 재접속하지 않도록 지터 추가)
+RECONNECT_MIN_DELAY = 1; RECONNECT_MAX_DELAY = 30; METRICS_INTERVAL = 5
+# JPEG 디코딩 워커 수, UI 갱신 주기, 이보다 작은(또는 숨겨진) 뷰의 프레임은 디코딩하지 않음
+DECODE_WORKERS = 2; UI_TICK_MS = 50; MIN_VIEW_SIZE = 40
+# 그리드 썸네일은 작고 저렴하게, 더블클릭한 포커스 뷰는 원본 해상도로 (서버가 max_kbps 예산과 전송 시간에 맞춰 품질/해상도 조절)
+THUMBNAIL_STREAM = {'width': 200, 'height': 150, 'fps': 10, 'quality': 70, 'max_kbps': 400}
+FOCUS_STREAM = {'width': 640, 'height': 480, 'fps': 15, 'quality': 90, 'max_kbps': 8000}
+# 전체 명령의 장비별 응답 기한, 연속 타임아웃이 이만큼 쌓이면 명령 연결을 끊고 재접속
+FLEET_COMMAND_DEADLINE = 5; MAX_CONSECUTIVE_TIMEOUTS = 3
 
 class JetsonController:
     def __init__(self, root):
         self.root = root
         self.root.title("Jetson AI Safety Controller - Final Version")
         self.root.geometry("1100x750")
-        
+
         self.jetson_ips = self.load_jetson_config()
         self.jetson_connections = {}
-        self.camera_threads = {}
         self.running = True
         self.connections_lock = threading.Lock()
-        
-        # 재연결 시도 중인 Jetson을 추적하기 위한 집합(set)
-        self.reconnecting_jetsons = set()
+
+        # 진행 중인 다운로드: (jetson, 파일명) -> 진행률(%)
+        self.downloads = {}; self.downloads_lock = threading.Lock()
+        # Jetson별 최근 metrics 응답 (FPS, p95 지연)
+        self.jetson_metrics = {}
+        # 재부팅 직후 모델 로드/워밍업이 끝나기 전인 Jetson의 기동 단계 (준비되면 제거)
+        self.jetson_startup = {}
+        # 서버가 푸시한 카메라별 경보 상태와 클래스별 개수: jetson -> {camera: ...}
+        self.alarms = {}; self.detection_counts = {}
+        # 디코딩이 끝나 다음 UI tick에 그릴 프레임(뷰별 최신 1장), 뷰 크기(숨겨지면 None), 디코딩 중인 뷰
+        self.pending_frames = {}; self.view_sizes = {}; self.decoding = set(); self.frames_dropped = 0; self.status_dirty = True
+        self.decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="decode")
+        # 명령 응답은 request_id로 매칭; 전체 명령 진행 중에는 metrics 폴링을 쉬어 명령이 우선 처리되도록 함
+        self.request_ids = itertools.count(1); self.fleet_in_flight = 0; self.last_fleet_result = None
 
         self.setup_ui()
         self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
-        self.auto_update_status()
+        # 모든 네트워크 I/O는 하나의 asyncio 루프(별도 스레드)에서 처리
+        self.loop = asyncio.new_event_loop(); self.io_task = None
+        threading.Thread(target=self.run_io_loop, daemon=True).start()
+        self.ui_tick()
 
-    def _send_command(self, name, command):
-        # ... (이전과 동일)
+    def run_io_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.io_task = asyncio.gather(*(self.unit_session(name, ip_config) for name, ip_config in self.jetson_ips.items()))
+        try: self.loop.run_until_complete(self.io_task)
+        except asyncio.CancelledError: pass
+        # 취소 중인 구독/다운로드 태스크가 정리될 때까지 루프를 돌린 뒤 종료
+        remaining = asyncio.all_tasks(self.loop)
+        for task in remaining: task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*remaining, return_exceptions=True))
+
+    def submit(self, coro):
+        """Schedule a coroutine on the I/O loop from any thread; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def request(self, name, command, timeout=COMMAND_TIMEOUT):
+        """Send one command tagged with a request_id and await the matching response; raises ConnectionError or asyncio.TimeoutError."""
         with self.connections_lock:
             conn_info = self.jetson_connections.get(name)
-        if not conn_info or not conn_info.get('connected'): return None
-        with conn_info['lock']:
+        if not conn_info: raise ConnectionError("not connected")
+        request_id = next(self.request_ids); future = self.loop.create_future(); conn_info['pending'][request_id] = future
+        try:
+            async with conn_info['write_lock']:
+                conn_info['writer'].write((json.dumps({**command, 'request_id': request_id}) + "\n").encode('utf-8'))
+                await conn_info['writer'].drain()
+            response = await asyncio.wait_for(future, timeout)
+            conn_info['timeouts'] = 0
+            return response
+        except asyncio.TimeoutError:
+            conn_info['timeouts'] += 1
+            if conn_info['timeouts'] >= MAX_CONSECUTIVE_TIMEOUTS:
+                self.log(f"{name} missed {conn_info['timeouts']} replies in a row. Disconnecting."); conn_info['closed'].set()
+            raise
+        finally: conn_info['pending'].pop(request_id, None)
+
+    async def command(self, name, command, timeout=COMMAND_TIMEOUT):
+        try: return await self.request(name, command, timeout)
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            self.log(f"{command['type']} on {name} failed: {e or 'timed out'}"); return None
+
+    async def read_responses(self, name, conn_info):
+        """Resolve pending requests as responses arrive, in whatever order the server finishes them."""
+        pending = conn_info['pending']
+        try:
+            while True:
+                line = await conn_info['reader'].readline()
+                if not line: raise ConnectionError("Server closed connection")
+                response = json.loads(line)
+                # request_id를 돌려주지 않는 구버전 서버는 순서대로 응답하므로 가장 오래된 요청에 매칭
+                future = pending.pop(response.pop('request_id', next(iter(pending), None)), None)
+                if future and not future.done(): future.set_result(response)
+        except asyncio.CancelledError: raise
+        except Exception as e:
+            if self.running: self.log(f"Connection error for {name}: {e}. Disconnecting.")
+        finally:
+            conn_info['closed'].set()
+            for future in pending.values():
+                if not future.done(): future.set_exception(ConnectionError("connection lost"))
+
+    async def fleet_command(self, command, names=None, deadline=FLEET_COMMAND_DEADLINE):
+        """Send command to all (or the given) units at once; returns {name: (outcome, latency_ms, detail)}, outcome ok/failed/timeout."""
+        names = list(self.jetson_ips) if names is None else names
+        async def one(name):
+            started = time.perf_counter()
             try:
-                sock = conn_info['socket']
-                sock.sendall((json.dumps(command) + "\n").encode('utf-8'))
-                buffer = conn_info['buffer']
-                while b"\n" not in buffer:
-                    sock.settimeout(10.0) 
-                    chunk = sock.recv(4096)
-                    if not chunk: raise ConnectionError("Server closed connection")
-                    buffer += chunk
-                response_data, buffer = buffer.split(b'\n', 1)
-                conn_info['buffer'] = buffer
-                return json.loads(response_data)
-            except Exception as e:
-                self.log(f"Connection error for {name}: {e}. Disconnecting.")
-                self.cleanup_connection_async(name)
-                return None
+                response = await self.request(name, command, deadline)
+                outcome = 'ok' if response.get('status') == 'success' else 'failed'; detail = response.get('message', '')
+            except asyncio.TimeoutError: outcome, detail = 'timeout', f"no reply within {deadline}s"
+            except (ConnectionError, OSError) as e: outcome, detail = 'failed', str(e)
+            return name, (outcome, round((time.perf_counter() - started) * 1000), detail)
+        self.fleet_in_flight += 1
+        try: results = dict(await asyncio.gather(*(one(name) for name in names)))
+        finally: self.fleet_in_flight -= 1
+        self.report_fleet_result(command['type'], results)
+        return results
 
-    def connect_jetson(self, name, ip_config):
-        with self.connections_lock:
-            if name in self.jetson_connections: return
+    def report_fleet_result(self, command_type, results):
+        totals = {outcome: sum(1 for result in results.values() if result[0] == outcome) for outcome in ('ok', 'failed', 'timeout')}
+        summary = f"{command_type}: {totals['ok']} ok, {totals['failed']} failed, {totals['timeout']} timed out"
+        ok = ", ".join(f"{name} {latency} ms" for name, (outcome, latency, _) in sorted(results.items(), key=lambda item: item[1][1]) if outcome == 'ok')
+        self.log(summary + (f" | {ok}" if ok else ""))
+        for name, (outcome, latency, detail) in results.items():
+            if outcome != 'ok': self.log(f"  {name}: {outcome} after {latency} ms ({detail})")
+        self.last_fleet_result = (time.strftime('%H:%M:%S'), summary); self.status_dirty = True
 
-        self.log(f"Connecting to {name} ({ip_config})...")
+    @staticmethod
+    def _parse_address(ip_config):
         try:
+            ip, port_str = ip_config.split(':')
+            return ip, int(port_str)
+        except ValueError:
+            return ip_config, 8888
+
+    @staticmethod
+    def _backoff(delay):
+        return min(delay * 2, RECONNECT_MAX_DELAY), delay * random.uniform(0.8, 1.2)
+
+    async def unit_session(self, name, ip_config):
+        """Keep one Jetson connected: command connection plus frame/event subscriptions, reconnecting with exponential backoff."""
+        address = self._parse_address(ip_config); delay = RECONNECT_MIN_DELAY; failures = 0
+        while self.running:
             try:
-                ip, port_str = ip_config.split(':')
-                port = int(port_str)
-            except ValueError:
-                ip, port = ip_config, 8888
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(*address), CONNECT_TIMEOUT)
+            except (OSError, asyncio.TimeoutError) as e:
+                failures += 1
+                # 오프라인 장비가 많아도 로그가 넘치지 않도록 첫 실패와 이후 백오프 최대치 도달 시에만 기록
+                if failures == 1 or delay == RECONNECT_MAX_DELAY: self.log(f"Failed to connect to {name} ({ip_config}): {e or 'timeout'}; retrying with backoff")
+                delay, wait = self._backoff(delay); await asyncio.sleep(wait); continue
+            self.log(f"Successfully connected to {name}."); delay = RECONNECT_MIN_DELAY; failures = 0
+            conn_info = {'reader': reader, 'writer': writer, 'ip': ip_config, 'address': address, 'write_lock': asyncio.Lock(), 'closed': asyncio.Event(),
+                         'pending': {}, 'timeouts': 0}
+            with self.connections_lock: self.jetson_connections[name] = conn_info
+            self.status_dirty = True
+            tasks = [asyncio.ensure_future(coro) for coro in (
+                self.read_responses(name, conn_info),
+                self.subscription(name, address, {'type': 'subscribe_stream', **THUMBNAIL_STREAM}, self.consume_frames),
+                self.subscription(name, address, {'type': 'subscribe_events'}, self.consume_events),
+                self.poll_metrics(name))]
+            try: await conn_info['closed'].wait()
+            finally:
+                for task in tasks: task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                writer.close(); self.cleanup_connection(name)
+            if self.running: delay, wait = self._backoff(delay); await asyncio.sleep(wait)
 
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(5)
-            sock.connect((ip, port))
-            self.log(f"Successfully connected to {name}.")
-            
-            with self.connections_lock:
-                self.jetson_connections[name] = {
-                    'socket': sock, 'ip': ip_config, 'connected': True,
-                    'buffer': b'', 'lock': threading.Lock()
-                }
-            self.start_camera_stream(name)
-        except Exception as e:
-            self.log(f"Failed to connect to {name}: {e}")
-        finally:
-            # 연결 시도가 끝났으므로, 재연결 목록에서 제거
-            if name in self.reconnecting_jetsons:
-                self.reconnecting_jetsons.remove(name)
-        
-        self.root.after(0, self.update_status_display)
+    async def subscription(self, name, address, command, consume):
+        """Hold a push connection opened by command; consume(name, reader, ack) runs until it drops, then resubscribe with backoff."""
+        delay = RECONNECT_MIN_DELAY
+        while self.running:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(*address), CONNECT_TIMEOUT)
+                try:
+                    writer.write((json.dumps(command) + "\n").encode('utf-8')); await writer.drain()
+                    ack = json.loads(await asyncio.wait_for(reader.readline(), COMMAND_TIMEOUT) or b'{}')
+                    if ack.get('status') != 'success': raise ConnectionError(f"{command['type']} refused: {ack}")
+                    delay = RECONNECT_MIN_DELAY
+                    await consume(name, reader, ack)
+                finally: writer.close()
+            except asyncio.CancelledError: raise
+            except Exception as e:
+                if self.running: self.log(f"{command['type']} for {name} interrupted: {e or type(e).__name__}")
+            delay, wait = self._backoff(delay); await asyncio.sleep(wait)
+
+    async def consume_frames(self, name, reader, ack, view=None):
+        view = view or name; display_size = (ack['width'], ack['height'])
+        while self.running:
+            size, = STREAM_HEADER.unpack(await asyncio.wait_for(reader.readexactly(STREAM_HEADER.size), STREAM_TIMEOUT))
+            payload = await asyncio.wait_for(reader.readexactly(size), STREAM_TIMEOUT)
+            view_size = self.view_sizes.get(view)
+            # 숨겨졌거나 너무 작은 뷰, 또는 이전 프레임을 아직 디코딩 중인 뷰는 이번 프레임을 버림
+            if view_size is None or min(view_size) < MIN_VIEW_SIZE or view in self.decoding: self.frames_dropped += 1; continue
+            self.decoding.add(view)
+            self.loop.run_in_executor(self.decode_pool, self.decode_frame, view, payload, display_size).add_done_callback(lambda _, v=view: self.decoding.discard(v))
+
+    def decode_frame(self, view, payload, display_size):
+        import cv2
+        try:
+            frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+            if frame is None: return
+            # 서버가 대역폭에 맞춰 해상도를 낮춘 경우에도 뷰 크기는 유지
+            if (frame.shape[1], frame.shape[0]) != display_size: frame = cv2.resize(frame, display_size)
+            self.pending_frames[view] = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+        except Exception as e: self.log(f"Frame decoding error for {view}: {e}")
+
+    def open_focus_view(self, name):
+        key = f"{name} (focus)"
+        if key in self.camera_views: self.camera_views[key]['window'].lift(); return
+        window = tk.Toplevel(self.root); window.title(f"{name} - Focus View"); window.geometry(f"{FOCUS_STREAM['width']}x{FOCUS_STREAM['height']}")
+        label = ttk.Label(window, text="Connecting...", background='gray'); label.pack(fill=tk.BOTH, expand=True)
+        stream = self.submit(self.subscription(name, self._parse_address(self.jetson_ips[name]), {'type': 'subscribe_stream', **FOCUS_STREAM},
+                                               functools.partial(self.consume_frames, view=key)))
+        self.camera_views[key] = {'label': label, 'window': window, 'stream': stream}
+        window.protocol("WM_DELETE_WINDOW", lambda: self.close_focus_view(key))
+    def close_focus_view(self, key):
+        view = self.camera_views.pop(key, None)
+        if not view: return
+        view['stream'].cancel(); view['window'].destroy()
+        self.view_sizes.pop(key, None); self.pending_frames.pop(key, None)
+
+    async def consume_events(self, name, reader, ack):
+        self.alarms[name] = dict(ack.get('alarms', {})); self.status_dirty = True
+        # heartbeat가 3번 연속 오지 않으면 연결이 죽은 것으로 간주
+        timeout = ack.get('heartbeat', 5) * 3
+        while self.running:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if not line: raise ConnectionError("Server closed event stream")
+            self.handle_event(name, json.loads(line))
+
+    async def poll_metrics(self, name):
+        while self.running:
+            if self.fleet_in_flight: await asyncio.sleep(0.5); continue
+            if name not in self.jetson_metrics or name in self.jetson_startup:
+                status = await self.command(name, {'type': 'status'})
+                if status and status.get('status') == 'success':
+                    # 구버전 서버는 ready 필드가 없으므로 준비된 것으로 간주
+                    if status.get('ready', True): self.jetson_startup.pop(name, None)
+                    else: self.jetson_startup[name] = status.get('startup', {})
+            response = await self.command(name, {'type': 'metrics'})
+            if response and response.get('status') == 'success':
+                self.jetson_metrics[name] = {'fps': response['fps'].get('inference'), 'p95': response['latency_ms']['inference'].get('p95')}; self.status_dirty = True
+            await asyncio.sleep(METRICS_INTERVAL)
 
     def cleanup_connection(self, name):
         with self.connections_lock:
-            conn_info = self.jetson_connections.pop(name, None)
-        if conn_info:
-            if conn_info.get('socket'):
-                try: conn_info['socket'].close()
-                except: pass
-        self.update_disconnected_view(name)
-        
-    def cleanup_connection_async(self, name):
-        self.root.after(0, self.cleanup_connection, name)
+            self.jetson_connections.pop(name, None)
+        self.alarms.pop(name, None); self.detection_counts.pop(name, None); self.pending_frames.pop(name, None)
+        self.jetson_metrics.pop(name, None); self.jetson_startup.pop(name, None)
+        self.status_dirty = True
+        if self.running: self.root.after(0, self.update_disconnected_view, name)
 
     def on_closing(self):
         self.running = False
-        with self.connections_lock:
-            connection_names = list(self.jetson_connections.keys())
-        for name in connection_names:
-            self.cleanup_connection(name)
+        if self.io_task: self.loop.call_soon_threadsafe(self.io_task.cancel)
+        self.decode_pool.shutdown(wait=False)
         self.root.destroy()
-        
-    def auto_update_status(self):
-        """(수정됨) 상태 표시 및 모든 연결(최초+재연결)을 관리하는 유일한 함수"""
-        self.update_status_display()
-        
-        with self.connections_lock:
-            connected_jetson_names = list(self.jetson_connections.keys())
 
-        for name, ip_config in self.jetson_ips.items():
-            is_connected = name in connected_jetson_names
-            is_reconnecting = name in self.reconnecting_jetsons
-            
-            # 연결되어 있지도 않고, 재연결 시도 중도 아니라면 -> 새로운 연결 시도
-            if not is_connected and not is_reconnecting:
-                self.log(f"{name} is disconnected. Attempting to connect...")
-                self.reconnecting_jetsons.add(name)
-                threading.Thread(target=self.connect_jetson, args=(name, ip_config), daemon=True).start()
-        
-        if self.running:
-            self.root.after(5000, self.auto_update_status)
+    def ui_tick(self):
+        """Single repaint point: at most one new image per view per tick, and the status panel only when something changed."""
+        for name, view in self.camera_views.items():
+            label = view['label']
+            self.view_sizes[name] = (label.winfo_width(), label.winfo_height()) if label.winfo_viewable() else None
+            image = self.pending_frames.pop(name, None)
+            if image is not None: self.update_camera_view(name, ImageTk.PhotoImage(image))
+        if self.status_dirty: self.status_dirty = False; self.update_status_display()
+        if self.running: self.root.after(UI_TICK_MS, self.ui_tick)
 
-    def start_camera_stream(self, name):
-        if name not in self.camera_threads or not self.camera_threads[name].is_alive():
-            thread = threading.Thread(target=self.camera_stream_worker, args=(name,), daemon=True)
-            self.camera_threads[name] = thread; thread.start()
-    def camera_stream_worker(self, name):
-        while self.running:
-            with self.connections_lock:
-                if not self.jetson_connections.get(name): break
-            response = self._send_command(name, {'type': 'get_frame'})
-            if response and response.get('status') == 'success' and response.get('frame'):
-                try:
-                    img_data = base64.b64decode(response['frame']); nparr = np.frombuffer(img_data, np.uint8)
-                    import cv2
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    if frame is not None:
-                        pil_image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-                        photo = ImageTk.PhotoImage(pil_image)
-                        self.root.after(0, self.update_camera_view, name, photo)
-                except Exception as e: self.log(f"Frame decoding error for {name}: {e}")
-            elif response is None: break
-            time.sleep(0.1)
-        self.log(f"Camera stream for {name} has stopped.")
-    def download_worker(self, name, filename, save_path):
+    def handle_event(self, name, event):
+        kind = event.get('event'); camera = event.get('camera')
+        if kind == 'alarm':
+            self.alarms.setdefault(name, {})[camera] = event['state']
+            counts = ", ".join(f"{cls} {count}" for cls, count in (event.get('counts') or {}).items())
+            self.log(f"⚠ ALARM {name}/{camera}: {event['state'].upper()}" + (f" ({counts})" if counts else "") if event['state'] != 'clear' else f"Alarm cleared on {name}/{camera}")
+        elif kind == 'detections':
+            self.detection_counts.setdefault(name, {})[camera] = event['counts']
+        elif kind == 'recording_started':
+            self.log(f"● Recording started on {name}/{camera}: {event['filename']}")
+        elif kind == 'recording_finished':
+            self.log(f"■ Recording finished on {name}/{camera}: {event['filename']} ({event['duration']}s)")
+        else: return
+        self.status_dirty = True
+    async def _download_once(self, name, filename, part_path):
+        """Fetch the remainder of a recording into part_path over a dedicated data connection; returns True when complete."""
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(*self._parse_address(self.jetson_ips[name])), CONNECT_TIMEOUT)
+        try:
+            writer.write((json.dumps({'type': 'download_recording', 'filename': filename, 'offset': offset}) + "\n").encode('utf-8')); await writer.drain()
+            ack = json.loads(await asyncio.wait_for(reader.readline(), COMMAND_TIMEOUT) or b'{}')
+            if ack.get('status') != 'success': raise FileNotFoundError(ack.get('message', f"Download refused: {ack}"))
+            total = ack['size']; offset = ack['offset']
+            with open(part_path, 'r+b' if os.path.exists(part_path) else 'wb') as f:
+                f.truncate(offset); f.seek(offset)
+                while self.running:
+                    chunk_offset, length, checksum = CHUNK_HEADER.unpack(await asyncio.wait_for(reader.readexactly(CHUNK_HEADER.size), STREAM_TIMEOUT))
+                    if length == 0: return chunk_offset == total
+                    if chunk_offset != offset or length > ack['chunk_size']: raise ConnectionError(f"Unexpected chunk at {chunk_offset} (expected {offset})")
+                    payload = await asyncio.wait_for(reader.readexactly(length), STREAM_TIMEOUT)
+                    if zlib.crc32(payload) != checksum: raise ConnectionError(f"Checksum mismatch at offset {offset}")
+                    # 디스크 쓰기가 I/O 루프(다른 장비 스트림)를 막지 않도록 워커에서 수행
+                    await self.loop.run_in_executor(None, f.write, payload); offset += length
+                    with self.downloads_lock: self.downloads[(name, filename)] = int(offset * 100 / total) if total else 100
+                    self.status_dirty = True
+        finally: writer.close()
+        return False
+    async def download(self, name, filename, save_path):
         self.log(f"Starting download of {filename} from {name}...")
-        response = self._send_command(name, {'type': 'download_recording', 'filename': filename})
-        if response and response.get('status') == 'success' and response.get('content'):
-            try:
-                file_content = base64.b64decode(response['content'])
-                with open(save_path, 'wb') as f: f.write(file_content)
-                self.log(f"Successfully downloaded {filename}")
-                messagebox.showinfo("Success", f"File '{filename}' downloaded successfully.")
-            except Exception as e: self.log(f"Failed to save downloaded file {filename}: {e}")
-        else: self.log(f"Download command failed for {filename}. Response: {response}")
+        part_path = save_path + ".part"
+        with self.downloads_lock: self.downloads[(name, filename)] = 0
+        try:
+            for attempt in range(1, DOWNLOAD_MAX_RETRIES + 1):
+                try:
+                    if await self._download_once(name, filename, part_path):
+                        os.replace(part_path, save_path)
+                        self.log(f"Successfully downloaded {filename}")
+                        self.root.after(0, lambda: messagebox.showinfo("Success", f"File '{filename}' downloaded successfully."))
+                        return
+                    if not self.running: return
+                except FileNotFoundError as e:
+                    self.log(f"Download failed for {filename}: {e}"); return
+                except Exception as e:
+                    self.log(f"Download of {filename} interrupted ({e or type(e).__name__}); resuming in {DOWNLOAD_RETRY_DELAY}s [{attempt}/{DOWNLOAD_MAX_RETRIES}]")
+                await asyncio.sleep(DOWNLOAD_RETRY_DELAY)
+            self.log(f"Giving up on {filename}; partial data kept at {part_path}")
+        finally:
+            with self.downloads_lock: self.downloads.pop((name, filename), None)
+            self.status_dirty = True
     def generic_command_individual(self, command_type):
         name = self.jetson_var.get()
-        if name: threading.Thread(target=self._send_command, args=(name, {'type': command_type}), daemon=True).start()
+        if name: self.submit(self.fleet_command({'type': command_type}, [name]))
     def generic_command_all(self, command_type):
-        with self.connections_lock: names = list(self.jetson_connections.keys())
-        for name in names: threading.Thread(target=self._send_command, args=(name, {'type': command_type}), daemon=True).start()
+        self.log(f"Sending {command_type} to {len(self.jetson_ips)} Jetsons...")
+        self.submit(self.fleet_command({'type': command_type}))
     def power_control(self, name, command):
         with self.connections_lock:
             if not name or not self.jetson_connections.get(name):
                 messagebox.showwarning("Warning", f"Please select a connected Jetson."); return
         if messagebox.askyesno("Confirm", f"Are you sure you want to {command} {name}?", icon='warning'):
             self.log(f"Sending {command} command to {name}...")
-            threading.Thread(target=self._send_command, args=(name, {'type': command}), daemon=True).start()
+            self.submit(self.fleet_command({'type': command}, [name]))
     def power_control_all(self, command):
         if messagebox.askyesno("Confirm", f"Are you sure you want to {command} ALL Jetsons?", icon='warning'):
-            with self.connections_lock: names = list(self.jetson_connections.keys())
-            for name in names:
-                def task(n, c):
-                    self.log(f"Sending {c} command to {n}...")
-                    self._send_command(n, {'type': c})
-                threading.Thread(target=task, args=(name, command), daemon=True).start()
+            self.log(f"Sending {command} command to {len(self.jetson_ips)} Jetsons...")
+            self.submit(self.fleet_command({'type': command}))
     def refresh_file_list(self):
         name = self.jetson_var.get()
         with self.connections_lock:
             if not name or not self.jetson_connections.get(name):
                 messagebox.showwarning("Warning", "Please select a connected Jetson."); return
-        def task():
+        async def task():
             self.log(f"Fetching file list from {name}...")
-            response = self._send_command(name, {'type': 'list_recordings'})
+            response = await self.command(name, {'type': 'list_recordings'})
             def update_ui():
                 self.file_listbox.delete(0, tk.END)
                 if response and response.get('status') == 'success':
@@ -193,16 +375,21 @@ class JetsonController:
                     self.log(f"Found {self.file_listbox.size()} files on {name}.")
                 else: self.log(f"Failed to get file list from {name}.")
             self.root.after(0, update_ui)
-        threading.Thread(target=task, daemon=True).start()
+        self.submit(task())
     def download_selected_file(self):
         name = self.jetson_var.get()
         selected_indices = self.file_listbox.curselection()
         if not name or not selected_indices:
             messagebox.showwarning("Warning", "Please select a Jetson and a file to download."); return
-        filename = self.file_listbox.get(selected_indices[0])
-        save_path = filedialog.asksaveasfilename(initialfile=filename, defaultextension=".mp4")
-        if save_path:
-            threading.Thread(target=self.download_worker, args=(name, filename, save_path), daemon=True).start()
+        filenames = [self.file_listbox.get(i) for i in selected_indices]
+        if len(filenames) == 1:
+            save_path = filedialog.asksaveasfilename(initialfile=filenames[0], defaultextension=".mp4")
+            targets = [(filenames[0], save_path)] if save_path else []
+        else:
+            save_dir = filedialog.askdirectory()
+            targets = [(f, os.path.join(save_dir, f)) for f in filenames] if save_dir else []
+        for filename, save_path in targets:
+            self.submit(self.download(name, filename, save_path))
     def setup_ui(self):
         main_frame = ttk.Frame(self.root, padding=10); main_frame.pack(fill=tk.BOTH, expand=True)
         control_panel = self._create_control_panel(main_frame); control_panel.pack(fill=tk.X, pady=(0, 10))
@@ -231,9 +418,9 @@ class JetsonController:
     def _create_info_panel(self, parent):
         frame = ttk.Frame(parent, width=350); frame.pack_propagate(False)
         status_frame = ttk.LabelFrame(frame, text="Status", padding=5); status_frame.pack(fill=tk.X, pady=(0, 10))
-        self.status_text = tk.Text(status_frame, height=5); self.status_text.pack(fill=tk.X, expand=True, pady=2)
+        self.status_text = tk.Text(status_frame, height=8); self.status_text.pack(fill=tk.X, expand=True, pady=2)
         file_frame = ttk.LabelFrame(frame, text="File Management", padding=5); file_frame.pack(fill=tk.X, pady=(0, 10))
-        self.file_listbox = tk.Listbox(file_frame, height=8); self.file_listbox.pack(fill=tk.X, expand=True)
+        self.file_listbox = tk.Listbox(file_frame, height=8, selectmode=tk.EXTENDED); self.file_listbox.pack(fill=tk.X, expand=True)
         file_btn_frame = ttk.Frame(file_frame); file_btn_frame.pack(fill=tk.X)
         ttk.Button(file_btn_frame, text="Refresh List", command=self.refresh_file_list).pack(side=tk.LEFT, expand=True, fill=tk.X)
         ttk.Button(file_btn_frame, text="Download Selected", command=self.download_selected_file).pack(side=tk.LEFT, expand=True, fill=tk.X)
@@ -246,6 +433,7 @@ class JetsonController:
             r, c = i // cols, i % cols; frame = ttk.LabelFrame(self.camera_container, text=jetson_name, padding=5);
             frame.grid(row=r, column=c, padx=5, pady=5, sticky="nsew"); img_label = ttk.Label(frame, text="Disconnected", background='gray');
             img_label.pack(fill=tk.BOTH, expand=True); self.camera_views[jetson_name] = {'label': img_label}
+            img_label.bind("<Double-Button-1>", lambda event, n=jetson_name: self.open_focus_view(n))
             self.camera_container.rowconfigure(r, weight=1); self.camera_container.columnconfigure(c, weight=1)
     def load_jetson_config(self):
         config = configparser.ConfigParser(); config_file = "jetson_config.ini"
@@ -267,7 +455,22 @@ class JetsonController:
             all_jetsons = self.jetson_ips.copy(); connected_jetsons = self.jetson_connections.copy()
         for name, ip in all_jetsons.items():
             status = "Connected" if name in connected_jetsons else "Disconnected"
+            metrics = self.jetson_metrics.get(name)
+            if name in connected_jetsons and metrics:
+                status += f" | {metrics['fps']:.1f} fps" + (f", p95 {metrics['p95']:.0f} ms" if metrics['p95'] is not None else "")
+            startup = self.jetson_startup.get(name)
+            if name in connected_jetsons and startup:
+                status += f" | startup failed: {startup.get('error')}" if startup.get('phase') == 'failed' else f" | starting ({startup.get('phase')}, {startup.get('uptime_s', 0):.0f}s)"
             status_info += f"{name} ({ip}): {status}\n"
+            if name not in connected_jetsons: continue
+            counts = self.detection_counts.get(name, {})
+            for camera, state in self.alarms.get(name, {}).items():
+                detected = ", ".join(f"{cls} {count}" for cls, count in counts.get(camera, {}).items() if count)
+                if state != 'clear' or detected: status_info += f"  {'⚠ ' + state.upper() if state != 'clear' else 'ok'} {camera}" + (f" ({detected})" if detected else "") + "\n"
+        if self.last_fleet_result: status_info += f"Last command [{self.last_fleet_result[0]}] {self.last_fleet_result[1]}\n"
+        with self.downloads_lock: downloads = dict(self.downloads)
+        for (name, filename), percent in downloads.items():
+            status_info += f"↓ {name}/{filename}: {percent}%\n"
         self.status_text.delete(1.0, tk.END); self.status_text.insert(tk.END, status_info)
             
 if __name__ == "__main__":
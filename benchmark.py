@@ -0,0 +1,164 @@
+"""Replay benchmark for jetson_server without a Jetson.
+
+Drives the full capture -> inference -> GPIO -> recording pipeline from the MP4s in SAVE_DIR (or synthetic frames)
+with the stub detector and fake GPIO from jetson_backends, then measures get_frame throughput with N concurrent
+clients. Results are written as JSON so releases can be compared:
+
+    python3 benchmark.py --duration 15 --clients 8 --output bench_results.json
+"""
+import argparse
+import asyncio
+import glob
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay/benchmark harness for jetson_server")
+    parser.add_argument("--videos", nargs="*", help="video files to replay (default: *.mp4 in jetson_server.SAVE_DIR)")
+    parser.add_argument("--cameras", type=int, default=1, help="number of camera streams to replay")
+    parser.add_argument("--synthetic", action="store_true", help="use synthetic frames instead of video files")
+    parser.add_argument("--unpaced", action="store_true", help="read sources as fast as possible instead of at their native FPS")
+    parser.add_argument("--detector", choices=["stub", "cpu", "engine"], default="stub")
+    parser.add_argument("--stub-latency-ms", type=float, default=20.0)
+    parser.add_argument("--fourcc", default="mp4v", help="recording codec (avc1 needs a hardware/OS H.264 encoder)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per pipeline phase")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent get_frame clients")
+    parser.add_argument("--client-seconds", type=float, default=5.0)
+    parser.add_argument("--output", default="bench_results.json")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+
+def git_revision():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except Exception: return None
+
+
+def camera_configs(server, args, work_dir):
+    sources = [] if args.synthetic else (args.videos or sorted(glob.glob(os.path.join(server.SAVE_DIR, "*.mp4"))))
+    configs = []
+    for i in range(args.cameras):
+        source = sources[i % len(sources)] if sources else "synthetic"
+        configs.append({"name": f"bench{i}", "source": source, "backend": "file" if sources else "synthetic", "realtime": not args.unpaced,
+                        "gpio": {"forklift": 100 + 3 * i, "person": 101 + 3 * i, "both": 102 + 3 * i}, "save_dir": os.path.join(work_dir, f"bench{i}")})
+    return configs
+
+
+def reset_latency(server):
+    for stage in list(server.latency): server.latency[stage] = server.LatencyTracker(server.METRICS_WINDOW)
+
+
+def run_phase(server, mode, duration):
+    """Run the pipeline for duration seconds with the stub detector in the given mode and summarise what happened."""
+    # 호출 수를 초기화해야 "cycle" 모드가 이전 구간·워밍업과 무관하게 항상 "both"부터 시작함
+    if hasattr(server.model, "mode"): server.model.mode = mode; server.model.calls = 0
+    reset_latency(server)
+    seq_before = {camera.name: camera.frame_seq for camera in server.cameras}
+    transitions_before = len(server.GPIO.transitions) if hasattr(server.GPIO, "transitions") else 0
+    inferred_before = sum(camera.scheduler.inferred for camera in server.cameras)
+    started = time.monotonic(); time.sleep(duration); elapsed = time.monotonic() - started
+    metrics = server.metrics_snapshot()
+    return {
+        "detector_mode": mode, "seconds": round(elapsed, 2),
+        "published_fps": {camera.name: round((camera.frame_seq - seq_before[camera.name]) / elapsed, 2) for camera in server.cameras},
+        "inferences_per_second": round((sum(camera.scheduler.inferred for camera in server.cameras) - inferred_before) / elapsed, 2),
+        "latency_ms": {stage: metrics["latency_ms"][stage] for stage in ("capture", "inference", "draw", "gpio", "record_write", "capture_to_gpio")},
+        "gpio_transitions": len(server.GPIO.transitions) - transitions_before if hasattr(server.GPIO, "transitions") else None,
+        "dropped": metrics["dropped"],
+    }
+
+
+async def get_frame_client(port, deadline, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    request = (json.dumps({"type": "get_frame"}) + "\n").encode(); count = 0
+    while time.monotonic() < deadline:
+        sent = time.perf_counter()
+        writer.write(request); await writer.drain()
+        response = json.loads(await reader.readline())
+        if response.get("status") == "success": latencies.append((time.perf_counter() - sent) * 1000); count += 1
+    writer.close()
+    return count
+
+
+async def get_frame_load(port, clients, seconds):
+    latencies = []; deadline = time.monotonic() + seconds
+    counts = await asyncio.gather(*(get_frame_client(port, deadline, latencies) for _ in range(clients)))
+    latencies.sort()
+    pick = lambda q: round(latencies[min(len(latencies) - 1, int(q * len(latencies)))], 2) if latencies else None
+    return {"clients": clients, "seconds": seconds, "responses": sum(counts), "responses_per_second": round(sum(counts) / seconds, 1),
+            "latency_ms": {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}}
+
+
+def send_command(port, command):
+    with socket.create_connection(("127.0.0.1", port)) as sock, sock.makefile("rb") as stream:
+        sock.sendall((json.dumps(command) + "\n").encode()); return json.loads(stream.readline())
+
+
+def main():
+    args = parse_args()
+    os.environ["FL_GPIO"] = "fake"; os.environ["FL_DETECTOR"] = args.detector; os.environ["FL_STUB_LATENCY_MS"] = str(args.stub_latency_ms)
+    os.environ["FL_RECORD_FOURCC"] = args.fourcc
+    work_dir = tempfile.mkdtemp(prefix="fl_bench_")
+    os.chdir(work_dir)  # 로그 파일과 녹화 인덱스가 작업 폴더에 생기도록
+    import jetson_server as server
+    logging.getLogger().setLevel(logging.WARNING)
+
+    config_path = os.path.join(work_dir, "cameras.json")
+    with open(config_path, "w") as f: json.dump(camera_configs(server, args, work_dir), f)
+    server.CAMERA_CONFIG_FILE = config_path; server.PORT = free_port(); server.METRICS_HTTP_PORT = None
+    workers = []; server.startup(workers)
+    if not server.model_ready.is_set(): raise SystemExit(f"Server startup failed: {server.startup_state['error']}")
+    threading.Thread(target=server.start_server, daemon=True).start()
+    time.sleep(1.0)
+    send_command(server.PORT, {"type": "start_tracking"})
+
+    phases = {"alarm_no_recording": run_phase(server, "person", args.duration), "alarm_with_recording": run_phase(server, "cycle", args.duration)}
+    baseline, recording = phases["alarm_no_recording"], phases["alarm_with_recording"]
+    p95 = lambda phase: phase["latency_ms"]["capture_to_gpio"]["p95"]
+    recording_overhead = {
+        "capture_to_gpio_p95_delta_ms": round(p95(recording) - p95(baseline), 2) if p95(recording) is not None and p95(baseline) is not None else None,
+        "inferences_per_second_delta": round(recording["inferences_per_second"] - baseline["inferences_per_second"], 2),
+        "record_write_ms": recording["latency_ms"]["record_write"],
+    }
+    get_frame = asyncio.run(get_frame_load(server.PORT, args.clients, args.client_seconds))
+    get_frame["preview_cache"] = {camera.name: camera.preview_cache.stats() for camera in server.cameras}
+
+    server.terminate = True
+    for worker in workers: worker.join(timeout=5)
+    recordings = {camera.name: camera.recording_index.query()[1] for camera in server.cameras}
+    # 구간 안에서 실제로 쓴 프레임이 없거나 클립이 저장되지 않았다면 녹화 오버헤드 수치는 의미가 없으므로 무효로 표시
+    written = recording["latency_ms"]["record_write"]["count"]
+    recording["valid"] = written > 0 and sum(recordings.values()) > 0
+    if not recording["valid"]:
+        open_failures = sum(camera.record_open_failures for camera in server.cameras)
+        recording["invalid_reason"] = (f"no frames written during the phase (fourcc '{args.fourcc}', {open_failures} VideoWriter open failures)" if not written
+                                       else "no clips recorded")
+        recording_overhead = {key: None for key in recording_overhead}
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"), "git_revision": git_revision(), "platform": platform.platform(),
+        "args": vars(args), "sources": [camera.source for camera in server.cameras], "startup": server.startup_state,
+        "phases": phases, "recording_overhead": recording_overhead, "get_frame": get_frame,
+        "recordings": recordings,
+    }
+    output = args.output if os.path.isabs(args.output) else os.path.join(os.environ.get("PWD", work_dir), args.output)
+    with open(output, "w") as f: json.dump(results, f, indent=2)
+    print(json.dumps({"published_fps": recording["published_fps"], "capture_to_gpio_p95_ms": p95(recording),
+                      "get_frame_rps": get_frame["responses_per_second"], "output": output}, indent=2))
+    if not recording["valid"]: raise SystemExit(f"Recording phase invalid: {recording['invalid_reason']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Stand-in GPIO, detector and frame source so jetson_server can run off-device (replay, benchmarks, CI)."""
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+
+class FakeGPIO:
+    """Drop-in for the Jetson.GPIO module surface used by jetson_server; records every pin transition with a timestamp."""
+    BOARD = 10; BCM = 11; OUT = 0; IN = 1; HIGH = 1; LOW = 0
+
+    def __init__(self, max_transitions=100000):
+        self.pins = {}; self.transitions = deque(maxlen=max_transitions); self.lock = threading.Lock()
+    def setwarnings(self, flag): pass
+    def setmode(self, mode): pass
+    def setup(self, pin, direction):
+        with self.lock: self.pins.setdefault(pin, self.LOW)
+    def output(self, pin, value):
+        with self.lock:
+            if self.pins.get(pin) != value: self.transitions.append((time.time(), pin, value))
+            self.pins[pin] = value
+    def input(self, pin):
+        with self.lock: return self.pins.get(pin, self.LOW)
+    def cleanup(self):
+        with self.lock: self.pins.clear()
+
+
+class StubBoxes:
+    def __init__(self, data): self.data = data
+    def __len__(self): return len(self.data)
+
+
+class StubResult:
+    def __init__(self, data): self.boxes = StubBoxes(data)
+
+
+class StubDetector:
+    """Callable with the YOLO call signature that sleeps for a configurable latency and emits scripted detections.
+
+    mode is one of "none", "person", "forklift", "both" or "cycle" (alternate "both" and "none" every cycle_frames calls).
+    """
+    def __init__(self, latency_ms=20.0, per_image_ms=2.0, mode="cycle", cycle_frames=90, class_ids=None):
+        self.latency_ms = latency_ms; self.per_image_ms = per_image_ms; self.mode = mode; self.cycle_frames = cycle_frames
+        self.class_ids = class_ids or {'forklift': 1, 'person': 2}; self.calls = 0
+    def detections(self, shape):
+        mode = self.mode
+        if mode == "cycle": mode = "both" if (self.calls // self.cycle_frames) % 2 == 0 else "none"
+        height, width = shape[:2]; rows = []
+        if mode in ("person", "both"): rows.append([width * 0.1, height * 0.4, width * 0.3, height * 0.95, 0.9, self.class_ids['person']])
+        if mode in ("forklift", "both"): rows.append([width * 0.5, height * 0.3, width * 0.9, height * 0.95, 0.9, self.class_ids['forklift']])
+        return np.array(rows, dtype=np.float32).reshape(-1, 6)
+    def __call__(self, frames, verbose=False, **kwargs):
+        batch = frames if isinstance(frames, list) else [frames]
+        time.sleep((self.latency_ms + self.per_image_ms * len(batch)) / 1000)
+        results = [StubResult(self.detections(frame.shape)) for frame in batch]
+        self.calls += 1
+        return results
+
+
+class SyntheticCapture:
+    """cv2.VideoCapture look-alike that renders a moving block over a static background, reading into the caller's buffer."""
+    def __init__(self, width=640, height=480, fps=30.0):
+        self.width = width; self.height = height; self.fps = fps; self.position = 0
+        self.background = np.full((height, width, 3), 60, np.uint8)
+        cv2.putText(self.background, "synthetic", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (200, 200, 200), 2)
+    def isOpened(self): return True
+    def read(self, image=None):
+        if image is None or image.shape != self.background.shape: image = np.empty_like(self.background)
+        np.copyto(image, self.background)
+        x = (self.position * 4) % (self.width - 80); self.position += 1
+        cv2.rectangle(image, (x, self.height // 2 - 40), (x + 80, self.height // 2 + 40), (0, 200, 255), -1)
+        return True, image
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS: return self.fps
+        if prop == cv2.CAP_PROP_FRAME_WIDTH: return self.width
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT: return self.height
+        return 0.0
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES: self.position = int(value)
+        return True
+    def release(self): pass
@@ -1,185 +1,989 @@
-import cv2
-import Jetson.GPIO as GPIO
-from ultralytics import YOLO
 import time
+PROCESS_STARTED = time.monotonic()
+import asyncio
+import cv2
+import numpy as np
 import threading
-import socket
 import json
+import struct
 import base64
 import logging
+import logging.handlers
 import signal
+import socket
 import sys
 import os
+import zlib
+from collections import deque
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
 
 PORT = 8888; CAMERA_ID = 0; SAVE_DIR = "/home/solwith/Desktop/FDD/Record"
-os.makedirs(SAVE_DIR, exist_ok=True)
+CAMERA_CONFIG_FILE = os.environ.get("FL_CAMERA_CONFIG", "jetson_cameras.json"); BATCH_DEADLINE_MS = 15
+# 장비 없이 실행하기 위한 백엔드 선택 (benchmark.py 참고): FL_GPIO=fake, FL_DETECTOR=stub|cpu|engine
+GPIO_BACKEND = os.environ.get("FL_GPIO", "jetson"); DETECTOR_BACKEND = os.environ.get("FL_DETECTOR", "engine")
+MODEL_PATH = os.environ.get("FL_MODEL_PATH", "model.engine"); STUB_LATENCY_MS = float(os.environ.get("FL_STUB_LATENCY_MS", 20))
+# 모델은 서버가 먼저 뜬 뒤 백그라운드에서 로드하고, 첫 경보가 CUDA/TensorRT 초기화 비용을 치르지 않도록 미리 몇 번 추론
+WARMUP_ITERATIONS = 3
 FRAME_WIDTH = 640; FRAME_HEIGHT = 480
-MAX_WORKERS = 20
+ENCODE_WORKERS = 2; STREAM_WRITE_BUFFER = 512 * 1024
+METRICS_WINDOW = 1024; METRICS_HTTP_PORT = int(os.environ.get("FL_METRICS_PORT", 9108)); LOG_FILE_MAX_MB = 10; LOG_FILE_BACKUPS = 3
+CAPTURE_QUEUE_SIZE = 1; RECORD_QUEUE_SIZE = 64
+# 카메라를 열지 못하면 그 카메라만 failed로 표시하고 지수 백오프로 재시도 (다른 카메라와 GPIO 경보는 계속 동작)
+CAMERA_RETRY_SECONDS = 1; CAMERA_RETRY_MAX_SECONDS = 30
+# 열린 뒤 연속으로 이만큼 읽기에 실패하면 장치가 죽은 것으로 보고 failed로 표시한 뒤 다시 연다
+CAMERA_MAX_READ_FAILURES = 20
+# 반환된 버퍼를 재사용을 위해 보관하는 최대 개수; 여유 버퍼가 없으면 새로 할당하므로 사용 중인 버퍼는 절대 덮어쓰지 않음
+FRAME_POOL_SIZE = RECORD_QUEUE_SIZE + CAPTURE_QUEUE_SIZE + 8
+# 풀이 채워지는 초기 구간 이후의 할당만 allocations_per_frame에 반영 (정상 상태에서는 0에 가까워야 함)
+FRAME_POOL_WARMUP_FRAMES = 100
+GSTREAMER_CSI_PIPELINE = ("nvarguscamerasrc sensor-id={sensor_id} ! video/x-raw(memory:NVMM),width={width},height={height},framerate=30/1 ! "
+                          "nvvidconv ! video/x-raw,format=BGRx ! videoconvert ! video/x-raw,format=BGR ! appsink drop=true max-buffers=1")
+STREAM_HEADER = struct.Struct('!I'); STREAM_MAX_FPS = 30; STREAM_DEFAULT_QUALITY = 80
+# 클라이언트별 적응형 스트림: 대역폭 예산(kbps, 0이면 무제한), 요청 품질 아래의 고정 품질 단계, 해상도 단계, 단계 변경 후 유지 프레임 수, 상향 전 연속 여유 프레임 수
+# 품질을 고정 단계로 맞춰야 여러 클라이언트가 같은 (크기, 품질) 인코딩을 공유하고 미리보기 캐시가 사다리 전체를 담을 수 있음
+STREAM_DEFAULT_KBPS = 2000; STREAM_MAX_KBPS = 50000; STREAM_QUALITY_LEVELS = (70, 50, 30)
+STREAM_SCALES = (1.0, 0.75, 0.5); STREAM_ADAPT_HOLD_FRAMES = 5; STREAM_UPGRADE_FRAMES = 30
+# 커널 송신 버퍼가 크면 느린 링크의 적체가 보이지 않으므로 스트림 소켓은 작게 제한
+STREAM_SOCKET_SNDBUF = 64 * 1024
+CHUNK_HEADER = struct.Struct('!QII'); DOWNLOAD_CHUNK_SIZE = 256 * 1024; DOWNLOAD_MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# 캐시 키 수: 스트림 크기 2종(그리드 썸네일, 포커스 창)의 전체 사다리(해상도 × (요청 품질 + 고정 단계)) + get_frame 등 여유분
+PREVIEW_DEFAULT_SIZE = (200, 150); PREVIEW_DEFAULT_QUALITY = 95; PREVIEW_CACHE_MAX_KEYS = 2 * len(STREAM_SCALES) * (len(STREAM_QUALITY_LEVELS) + 1) + 8
+# 이벤트 푸시: 구독자별 큐 크기, 유휴 연결 heartbeat 주기, 클래스별 개수 이벤트 최소 간격
+EVENT_QUEUE_SIZE = 256; EVENT_HEARTBEAT_SECONDS = 5; EVENT_COUNTS_INTERVAL = 1.0
+# 응답 후 연결을 푸시/바이너리 전용으로 바꾸는 명령 (request_id가 있어도 순서대로 처리)
+PUSH_COMMANDS = ("subscribe_stream", "subscribe_events", "download_recording")
+CAMERA_COMMANDS = ("get_frame", "subscribe_stream", "list_recordings", "download_recording")
 POST_RECORD_BUFFER_SECONDS = 10; MAX_RECORD_FOLDER_SIZE_MB = 1024
+RECORD_FPS = 15; RECORD_INDEX_FILENAME = "recordings_index.json"
+# 녹화 코덱 (하드웨어 H.264 인코더가 없는 환경은 FL_RECORD_FOURCC=mp4v); 열기 실패 시 재시도까지 대기 시간
+RECORD_FOURCC = os.environ.get("FL_RECORD_FOURCC", "avc1"); RECORD_OPEN_RETRY_SECONDS = 10
+PRE_RECORD_BUFFER_SECONDS = 5; PRE_RECORD_BUFFER_MB = 48; PRE_RECORD_JPEG_QUALITY = 90
 CLASS_NAME = ['driver', 'forklift', 'person']; TARGET_CLASS = {'forklift': 1, 'person': 2}
-FORKLIFT_GPIO = 7; PERSON_GPIO = 29; BOTH_GPIO = 31; ALL_GPIO = [FORKLIFT_GPIO, PERSON_GPIO, BOTH_GPIO]
-
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.FileHandler('jetson_safety_system.log'), logging.StreamHandler()])
-GPIO.setwarnings(False); GPIO.setmode(GPIO.BOARD)
-for pin in ALL_GPIO: GPIO.setup(pin, GPIO.OUT); GPIO.output(pin, GPIO.LOW)
+CLASS_CONFIDENCE = {'forklift': 0.5, 'person': 0.4}; ALARM_ON_FRAMES = 2; ALARM_OFF_FRAMES = 10
+MOTION_GATE = True; MOTION_SIZE = (80, 60); MOTION_PIXEL_DELTA = 25; MOTION_AREA_RATIO = 0.005; MOTION_REFERENCE_ALPHA = 0.1
+ACTIVE_HOLD_SECONDS = 5; MIN_IDLE_INTERVAL_SECONDS = 0.1; MAX_DETECTION_LATENCY_SECONDS = 1.0
+FORKLIFT_GPIO = 7; PERSON_GPIO = 29; BOTH_GPIO = 31
+# jetson_cameras.json이 없으면 기존 단일 카메라 구성으로 동작
+DEFAULT_CAMERAS = [{"name": "cam0", "source": CAMERA_ID, "backend": "auto", "gpio": {"forklift": FORKLIFT_GPIO, "person": PERSON_GPIO, "both": BOTH_GPIO}, "save_dir": SAVE_DIR}]
 
-tracking_active = False; latest_frame = None; terminate = False
-recording = False; recording_stop_time = 0; video_writer = None
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.handlers.RotatingFileHandler('jetson_safety_system.log', maxBytes=LOG_FILE_MAX_MB * 1024 * 1024, backupCount=LOG_FILE_BACKUPS), logging.StreamHandler()])
+tracking_active = False; terminate = False
 
-frame_lock = threading.Lock()
+capture_ready = threading.Condition()
+encode_pool = ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode")
 gpio_lock = threading.Lock()
 state_lock = threading.Lock()
 
-model = YOLO("model.engine")
+# GPIO와 모델은 startup()에서 초기화 (무거운 import를 서버 기동 뒤로 미룸)
+GPIO = None; model = None; INFERENCE_KWARGS = {}
+model_ready = threading.Event()
+startup_state = {"phase": "starting", "phases": {}, "error": None}
+
+class FrameQueue:
+    """Bounded queue that drops its oldest item when full, so consumers always get the freshest data."""
+    def __init__(self, maxsize, on_drop=None):
+        self.maxsize = maxsize; self.items = deque(); self.dropped = 0; self.on_drop = on_drop
+        self.cond = threading.Condition()
+    def put(self, item):
+        dropped = None
+        with self.cond:
+            if len(self.items) >= self.maxsize: dropped = self.items.popleft(); self.dropped += 1
+            self.items.append(item); self.cond.notify()
+        if dropped is not None and self.on_drop: self.on_drop(dropped)
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.items: self.cond.wait(timeout)
+            return self.items.popleft() if self.items else None
+    def __len__(self):
+        with self.cond: return len(self.items)
+
+class StageMeter:
+    """Frames-per-second counter for a single pipeline stage (only ever ticked by its own thread)."""
+    def __init__(self, window=1.0):
+        self.window = window; self.count = 0; self.fps = 0.0; self.window_start = time.monotonic()
+    def tick(self):
+        self.count += 1; now = time.monotonic(); elapsed = now - self.window_start
+        if elapsed >= self.window: self.fps = self.count / elapsed; self.count = 0; self.window_start = now
+
+class FramePool:
+    """Reference-counted frame buffers: every holder (capture queue, published frame, record queue, preview encode) retains a buffer
+    and releases it when done; only a buffer with no holders goes back on the free list, so capture never reads into a live frame."""
+    def __init__(self, capacity, warmup_frames=FRAME_POOL_WARMUP_FRAMES):
+        self.capacity = capacity; self.free = deque(); self.refs = {}; self.acquired = 0; self.allocations = 0
+        self.warmup_frames = warmup_frames; self.warmup_allocations = None
+        self.lock = threading.Lock()
+    def acquire(self, shape):
+        with self.lock:
+            buffer = None
+            while self.free and buffer is None:
+                candidate = self.free.pop()
+                if candidate.shape == shape: buffer = candidate
+            if buffer is None: buffer = np.empty(shape, np.uint8); self.allocations += 1
+            self.refs[id(buffer)] = [buffer, 1]; self.acquired += 1
+            if self.acquired == self.warmup_frames: self.warmup_allocations = self.allocations
+            return buffer
+    def adopt(self, buffer, frame):
+        # 백엔드가 다른 크기로 새 배열을 돌려준 경우 원래 버퍼는 반환하고 새 배열을 풀에 등록
+        self.release(buffer)
+        with self.lock: self.refs[id(frame)] = [frame, 1]; self.allocations += 1
+    def retain(self, frame):
+        with self.lock:
+            entry = self.refs.get(id(frame))
+            if entry is not None: entry[1] += 1
+    def release(self, frame):
+        with self.lock:
+            entry = self.refs.get(id(frame))
+            if entry is None: return
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self.refs[id(frame)]
+                if len(self.free) < self.capacity: self.free.append(entry[0])
+    def stats(self):
+        with self.lock:
+            in_use = len(self.refs); free = len(self.free); measured = self.acquired - self.warmup_frames
+            per_frame = round((self.allocations - self.warmup_allocations) / measured, 4) if self.warmup_allocations is not None and measured > 0 else None
+        return {"acquired": self.acquired, "allocations": self.allocations, "in_use": in_use, "free": free, "allocations_per_frame": per_frame}
+
+class LatencyTracker:
+    """Rolling window of the last METRICS_WINDOW latency samples (ms) for one pipeline stage, summarised as percentiles."""
+    def __init__(self, window):
+        self.samples = deque(maxlen=window); self.count = 0; self.lock = threading.Lock()
+    def observe(self, latency_ms):
+        with self.lock: self.samples.append(latency_ms); self.count += 1
+    def summary(self):
+        with self.lock: samples = sorted(self.samples); count = self.count
+        if not samples: return {"count": count, "p50": None, "p95": None, "p99": None, "max": None}
+        pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))], 2)
+        return {"count": count, "p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "max": round(samples[-1], 2)}
+
+class PreviewCache:
+    """Encodes each published frame at most once per (size, quality) and shares the JPEG bytes across clients."""
+    def __init__(self, camera, max_keys):
+        self.camera = camera; self.max_keys = max_keys; self.entries = {}; self.resize_buffers = {}; self.hits = 0; self.misses = 0
+        # 키별 락을 무한정 만들지 않도록 고정 개수의 락을 해시로 나눠 씀 (같은 키는 항상 같은 락이라 리사이즈 버퍼도 안전)
+        self.key_locks = [threading.Lock() for _ in range(max_keys)]
+        self.lock = threading.Lock()
+    def get(self, size, quality):
+        key = (size, quality)
+        with self.key_locks[hash(key) % len(self.key_locks)]:
+            frame, seq = self.camera.snapshot(retain=True)
+            if frame is None: return None, None
+            try:
+                entry = self.entries.get(key)
+                if entry is not None and entry[0] == seq:
+                    with self.lock: self.hits += 1
+                    return entry
+                resized = self.resize_buffers.get(key)
+                if resized is None: resized = self.resize_buffers[key] = np.empty((size[1], size[0], 3), np.uint8)
+                cv2.resize(frame, size, dst=resized)
+            finally: self.camera.frame_pool.release(frame)
+            ok, img_encoded = cv2.imencode(".jpg", resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not ok: return None, None
+            entry = (seq, img_encoded.tobytes())
+            with self.lock:
+                self.misses += 1; self.entries.pop(key, None); self.entries[key] = entry
+                while len(self.entries) > self.max_keys:
+                    evicted = next(iter(self.entries)); self.entries.pop(evicted); self.resize_buffers.pop(evicted, None)
+            return entry
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 3) if total else 0.0, "sizes": len(self.entries)}
+
+class StreamAdapter:
+    """Per-client quality/resolution ladder: steps quality and then resolution down when frames exceed the bandwidth budget or take
+    longer than a frame interval to leave the send buffer, and back up after a run of frames well inside both."""
+    def __init__(self, size, quality, fps, max_kbps):
+        self.max_size = size; self.interval = 1.0 / fps
+        self.qualities = (quality,) + tuple(level for level in STREAM_QUALITY_LEVELS if level < quality)
+        self.budget = max_kbps * 1000 / 8 * self.interval if max_kbps else None  # 프레임당 바이트
+        self.quality_index = 0; self.scale_index = 0; self.written = 0; self.in_flight = deque()
+        self.send_time = 0.0; self.hold = 0; self.good = 0; self.changes = 0
+    @property
+    def quality(self): return self.qualities[self.quality_index]
+    @property
+    def size(self):
+        scale = STREAM_SCALES[self.scale_index]
+        if scale == 1.0: return self.max_size
+        return max(16, int(self.max_size[0] * scale) // 4 * 4), max(16, int(self.max_size[1] * scale) // 4 * 4)
+    def sent(self, nbytes, now):
+        self.written += nbytes; self.in_flight.append((self.written, now))
+    def update(self, frame_bytes, buffered, now):
+        """Account for bytes the transport has flushed since the last call, then adapt; buffered is the transport's pending byte count."""
+        drained = self.written - buffered
+        while self.in_flight and self.in_flight[0][0] <= drained:
+            _, written_at = self.in_flight.popleft(); self.send_time = 0.8 * self.send_time + 0.2 * (now - written_at)
+        slow = self.send_time > self.interval or (self.in_flight and now - self.in_flight[0][1] > self.interval)
+        over = self.budget is not None and frame_bytes > self.budget
+        if self.hold: self.hold -= 1; return
+        if slow or over: self.good = 0; self.step(-1)
+        elif self.budget is None or frame_bytes < 0.6 * self.budget:
+            self.good += 1
+            if self.good >= STREAM_UPGRADE_FRAMES: self.good = 0; self.step(1)
+    def step(self, direction):
+        # 하향은 품질 먼저, 그다음 해상도; 상향은 해상도 먼저 복원
+        before = (self.quality_index, self.scale_index)
+        if direction < 0:
+            if self.quality_index < len(self.qualities) - 1: self.quality_index += 1
+            elif self.scale_index < len(STREAM_SCALES) - 1: self.scale_index += 1
+        elif self.scale_index > 0: self.scale_index -= 1
+        elif self.quality_index > 0: self.quality_index -= 1
+        if (self.quality_index, self.scale_index) != before: self.changes += 1; self.hold = STREAM_ADAPT_HOLD_FRAMES
+
+class EventHub:
+    """Fans out compact events from worker threads to subscribed asyncio clients; a slow subscriber drops its oldest events."""
+    def __init__(self, max_queue):
+        self.max_queue = max_queue; self.subscribers = set(); self.loop = None; self.seq = 0; self.published = 0; self.dropped = 0
+        self.lock = threading.Lock()
+    def bind(self, loop): self.loop = loop
+    def subscribe(self):
+        queue = asyncio.Queue(self.max_queue); self.subscribers.add(queue); return queue
+    def unsubscribe(self, queue): self.subscribers.discard(queue)
+    def publish(self, kind, camera, **fields):
+        with self.lock:
+            self.seq += 1; self.published += 1
+            event = {"type": "event", "event": kind, "seq": self.seq, "time": round(time.time(), 3), "camera": camera.name, **fields}
+        if self.loop is None or not self.subscribers: return
+        try: self.loop.call_soon_threadsafe(self._fan_out, event)
+        except RuntimeError: pass  # 서버 루프 종료 후
+    def _fan_out(self, event):
+        for queue in self.subscribers:
+            if queue.full(): queue.get_nowait(); self.dropped += 1
+            queue.put_nowait(event)
+    def stats(self):
+        return {"subscribers": len(self.subscribers), "published": self.published, "dropped": self.dropped}
+
+class PreRollBuffer:
+    """Ring of recent frames kept as JPEG bytes within a fixed RAM budget, flushed into a clip when an event starts."""
+    def __init__(self, seconds, max_bytes):
+        self.seconds = seconds; self.max_bytes = max_bytes; self.frames = deque(); self.nbytes = 0
+        self.lock = threading.Lock()
+    def push(self, frame, captured_at):
+        ok, img_encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, PRE_RECORD_JPEG_QUALITY])
+        if not ok: return
+        data = img_encoded.tobytes()
+        with self.lock:
+            self.frames.append((captured_at, data)); self.nbytes += len(data)
+            while self.frames and (self.nbytes > self.max_bytes or captured_at - self.frames[0][0] > self.seconds):
+                _, old = self.frames.popleft(); self.nbytes -= len(old)
+    def drain(self):
+        while True:
+            with self.lock:
+                if not self.frames: return
+                captured_at, data = self.frames.popleft(); self.nbytes -= len(data)
+            frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if frame is not None: yield captured_at, frame
+    def stats(self):
+        with self.lock:
+            span = self.frames[-1][0] - self.frames[0][0] if len(self.frames) > 1 else 0.0
+            return {"frames": len(self.frames), "seconds": round(span, 1), "mb": round(self.nbytes / (1024 * 1024), 1)}
+
+class RecordingIndex:
+    """Index of closed clips (size, duration, start time, detections) persisted as JSON; enforces the folder size cap oldest-first."""
+    def __init__(self, save_dir, index_file, max_bytes):
+        self.save_dir = save_dir; self.index_file = index_file; self.max_bytes = max_bytes
+        self.entries = {}; self.total_bytes = 0; self.lock = threading.Lock(); self.save_lock = threading.Lock()
+        self.load()
+    def load(self):
+        try:
+            with open(self.index_file) as f: self.entries = {entry["filename"]: entry for entry in json.load(f)}
+        except FileNotFoundError: pass
+        except Exception as e: logging.warning(f"Recording index unreadable, rebuilding: {e}")
+        # 인덱스 파일과 실제 디스크 내용을 한 번만 맞춰 둠 (이후에는 증분 갱신)
+        on_disk = {f for f in os.listdir(self.save_dir) if f.endswith('.mp4')}
+        for filename in set(self.entries) - on_disk: del self.entries[filename]
+        for filename in on_disk - set(self.entries):
+            path = os.path.join(self.save_dir, filename)
+            try: start = datetime.strptime(filename[:-4], "%Y_%m_%d_%H_%M_%S").timestamp()
+            except ValueError: start = os.path.getmtime(path)
+            self.entries[filename] = {"filename": filename, "size": os.path.getsize(path), "start": start, "duration": None, "detections": {}}
+        self.total_bytes = sum(entry["size"] for entry in self.entries.values())
+        self.evict(self.take_evictions()); self.save()
+        logging.info(f"Recording index loaded: {len(self.entries)} clips, {self.total_bytes / (1024 * 1024):.1f} MB")
+    def save(self):
+        # 파일 쓰기는 인덱스 락 밖에서 하므로 list_recordings 조회가 느린 SD 카드에 막히지 않음
+        with self.save_lock:
+            with self.lock: entries = list(self.entries.values())
+            tmp_path = self.index_file + ".tmp"
+            with open(tmp_path, "w") as f: json.dump(entries, f)
+            os.replace(tmp_path, self.index_file)
+    def add(self, filename, start, duration, detections):
+        size = os.path.getsize(os.path.join(self.save_dir, filename))
+        with self.lock:
+            old = self.entries.get(filename)
+            if old: self.total_bytes -= old["size"]
+            self.entries[filename] = {"filename": filename, "size": size, "start": start, "duration": duration, "detections": detections}
+            self.total_bytes += size
+            victims = self.take_evictions()
+        self.evict(victims); self.save()
+    def take_evictions(self):
+        """Drop the oldest entries until the folder fits max_bytes (caller holds the lock); the files are deleted by evict()."""
+        victims = []
+        for entry in sorted(self.entries.values(), key=lambda e: e["start"]):
+            if self.total_bytes <= self.max_bytes: break
+            del self.entries[entry["filename"]]; self.total_bytes -= entry["size"]; victims.append(entry)
+        return victims
+    def evict(self, victims):
+        for entry in victims:
+            try: os.remove(os.path.join(self.save_dir, entry["filename"]))
+            except FileNotFoundError: pass
+            except OSError as e:
+                # 지우지 못한 파일은 디스크에 남아 있으므로 인덱스에 되돌림
+                logging.error(f"Failed to evict {entry['filename']}: {e}")
+                with self.lock: self.entries[entry["filename"]] = entry; self.total_bytes += entry["size"]
+                continue
+            logging.info(f"Evicted recording {entry['filename']} ({entry['size'] / (1024 * 1024):.1f} MB) to stay under {self.max_bytes / (1024 * 1024):.0f} MB")
+    def query(self, offset=0, limit=None, since=None, until=None):
+        with self.lock:
+            matches = [entry for entry in self.entries.values() if (since is None or entry["start"] >= since) and (until is None or entry["start"] < until)]
+            total_bytes = self.total_bytes
+        matches.sort(key=lambda e: e["start"], reverse=True)
+        page = matches[offset:offset + limit] if limit is not None else matches[offset:]
+        return page, len(matches), total_bytes
+
+class Hysteresis:
+    """Debounces a per-frame boolean: turns on after on_frames consecutive hits and off after off_frames consecutive misses."""
+    def __init__(self, on_frames, off_frames):
+        self.on_frames = on_frames; self.off_frames = off_frames; self.state = False; self.hits = 0; self.misses = 0
+    def update(self, detected):
+        if detected: self.hits += 1; self.misses = 0
+        else: self.misses += 1; self.hits = 0
+        if not self.state and self.hits >= self.on_frames: self.state = True
+        elif self.state and self.misses >= self.off_frames: self.state = False
+        return self.state
+    def reset(self):
+        self.state = False; self.hits = 0; self.misses = 0
+
+class InferenceScheduler:
+    """Motion-gated inference rate: full rate on motion or a recent detection, backing off to one inference per max_latency when static."""
+    def __init__(self, max_latency):
+        self.max_latency = max_latency; self.reference = None; self.interval = 0.0
+        self.last_inference = 0.0; self.last_activity = 0.0; self.inferred = 0; self.skipped = 0
+        width, height = MOTION_SIZE
+        self.small = np.empty((height, width, 3), np.uint8); self.gray = np.empty((height, width), np.uint8)
+        self.gray_f = np.empty((height, width), np.float32); self.delta = np.empty((height, width), np.float32); self.moved = np.empty((height, width), np.float32)
+    def detect_motion(self, frame):
+        cv2.resize(frame, MOTION_SIZE, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray); np.copyto(self.gray_f, self.gray)
+        if self.reference is None: self.reference = self.gray_f.copy(); return True
+        cv2.absdiff(self.gray_f, self.reference, dst=self.delta)
+        cv2.accumulateWeighted(self.gray_f, self.reference, MOTION_REFERENCE_ALPHA)
+        cv2.threshold(self.delta, MOTION_PIXEL_DELTA, 1, cv2.THRESH_BINARY, dst=self.moved)
+        return cv2.countNonZero(self.moved) > MOTION_AREA_RATIO * self.moved.size
+    def should_infer(self, frame):
+        now = time.monotonic()
+        if not MOTION_GATE or self.detect_motion(frame): self.last_activity = now; self.interval = 0.0
+        if now - self.last_activity < ACTIVE_HOLD_SECONDS: run = True
+        else:
+            # 정적인 장면에서는 추론 간격을 두 배씩 늘리되 max_latency를 넘지 않음
+            run = now - self.last_inference >= self.interval
+            if run: self.interval = min(max(self.interval * 2, MIN_IDLE_INTERVAL_SECONDS), self.max_latency)
+        if run: self.last_inference = now; self.inferred += 1
+        else: self.skipped += 1
+        return run
+    def note_detection(self, detected):
+        if detected: self.last_activity = time.monotonic(); self.interval = 0.0
+    def stats(self):
+        return {"inferred": self.inferred, "skipped": self.skipped, "idle_interval_s": round(self.interval, 2)}
+
+class Camera:
+    """One capture source with its own GPIO zone, queues, preview cache, pre-roll buffer and recordings folder."""
+    def __init__(self, name, source, gpio, save_dir, max_record_mb, zones=None, confidence=None, max_detection_latency=MAX_DETECTION_LATENCY_SECONDS, backend="auto", realtime=True):
+        self.name = name; self.source = source; self.backend = backend; self.realtime = realtime; self.save_dir = save_dir
+        self.forklift_gpio = gpio["forklift"]; self.person_gpio = gpio["person"]; self.both_gpio = gpio["both"]
+        self.pins = [self.forklift_gpio, self.person_gpio, self.both_gpio]
+        # 위험 구역 다각형(프레임 픽셀 좌표)과 클래스별 최소 신뢰도; 구역이 없으면 화면 전체가 대상
+        self.zones = [np.array(zone, dtype=np.int32).reshape(-1, 1, 2) for zone in zones or []]; self.zone_mask = None
+        thresholds = {**CLASS_CONFIDENCE, **(confidence or {})}
+        self.conf_thresholds = np.array([thresholds.get(class_name, np.inf) if class_name in TARGET_CLASS else np.inf for class_name in CLASS_NAME])
+        self.alarm_filters = {class_name: Hysteresis(ALARM_ON_FRAMES, ALARM_OFF_FRAMES) for class_name in TARGET_CLASS}
+        self.alarm_state = "clear"; self.event_counts = None; self.event_counts_at = 0.0
+        self.scheduler = InferenceScheduler(max_detection_latency)
+        self.frame_pool = FramePool(FRAME_POOL_SIZE); self.frame_shape = (FRAME_HEIGHT, FRAME_WIDTH, 3)
+        os.makedirs(save_dir, exist_ok=True)
+        self.latest_frame = None; self.frame_seq = 0
+        self.frame_lock = threading.Lock(); self.frame_cond = threading.Condition(self.frame_lock)
+        self.capture_queue = FrameQueue(CAPTURE_QUEUE_SIZE, on_drop=lambda item: self.frame_pool.release(item[0]))
+        self.record_queue = FrameQueue(RECORD_QUEUE_SIZE, on_drop=lambda item: self.frame_pool.release(item[0]))
+        self.meters = {'capture': StageMeter(), 'record': StageMeter()}
+        self.failed = False; self.open_failures = 0; self.record_open_failures = 0
+        self.preview_cache = PreviewCache(self, PREVIEW_CACHE_MAX_KEYS)
+        self.pre_roll = PreRollBuffer(PRE_RECORD_BUFFER_SECONDS, PRE_RECORD_BUFFER_MB * 1024 * 1024)
+        self.recording_index = RecordingIndex(save_dir, os.path.join(save_dir, RECORD_INDEX_FILENAME), max_record_mb * 1024 * 1024)
+    def publish(self, frame):
+        self.frame_pool.retain(frame)
+        with self.frame_cond:
+            previous = self.latest_frame; self.latest_frame = frame; self.frame_seq += 1
+            self.frame_cond.notify_all()
+        if previous is not None: self.frame_pool.release(previous)
+    def snapshot(self, retain=False):
+        """Latest published frame and its sequence number; with retain=True the caller must frame_pool.release() the frame."""
+        with self.frame_lock:
+            if retain and self.latest_frame is not None: self.frame_pool.retain(self.latest_frame)
+            return self.latest_frame, self.frame_seq
+    def record(self, frame, is_danger, captured_at, counts):
+        self.frame_pool.retain(frame); self.record_queue.put((frame, is_danger, captured_at, counts))
+    def zone_mask_for(self, shape):
+        if not self.zones: return None
+        if self.zone_mask is None or self.zone_mask.shape != shape[:2]:
+            self.zone_mask = np.zeros(shape[:2], dtype=np.uint8); cv2.fillPoly(self.zone_mask, self.zones, 1)
+        return self.zone_mask
+    def reset_alarms(self):
+        for alarm_filter in self.alarm_filters.values(): alarm_filter.reset()
+    def stats(self):
+        return {
+            "status": "failed" if self.failed else "ok", "open_failures": self.open_failures, "record_open_failures": self.record_open_failures,
+            "fps": {stage: round(meter.fps, 1) for stage, meter in self.meters.items()},
+            "queue_depth": {"capture": len(self.capture_queue), "record": len(self.record_queue)},
+            "dropped": {"capture": self.capture_queue.dropped, "record": self.record_queue.dropped},
+            "pre_roll": self.pre_roll.stats(), "preview_cache": self.preview_cache.stats(), "inference_gate": self.scheduler.stats(),
+            "frame_pool": self.frame_pool.stats(),
+        }
+
+def load_cameras():
+    configs = DEFAULT_CAMERAS
+    if os.path.exists(CAMERA_CONFIG_FILE):
+        with open(CAMERA_CONFIG_FILE) as f: configs = json.load(f)
+    # 녹화 폴더 용량 제한은 카메라 수만큼 나눠서 적용
+    default_record_mb = MAX_RECORD_FOLDER_SIZE_MB // len(configs)
+    return [Camera(config.get("name", f"cam{i}"), config.get("source", i), config["gpio"], config.get("save_dir", os.path.join(SAVE_DIR, config.get("name", f"cam{i}"))),
+                   config.get("max_record_mb", default_record_mb), config.get("zones"), config.get("confidence"),
+                   config.get("max_detection_latency", MAX_DETECTION_LATENCY_SECONDS), config.get("backend", "auto"), config.get("realtime", True)) for i, config in enumerate(configs)]
+
+cameras = []; ALL_GPIO = []; inference_meter = StageMeter(); events = EventHub(EVENT_QUEUE_SIZE)
+latency = {stage: LatencyTracker(METRICS_WINDOW) for stage in ("capture", "inference", "draw", "gpio", "record_write", "capture_to_gpio")}
+stream_skipped = 0
+
+def init_gpio():
+    global GPIO
+    if GPIO_BACKEND == "fake":
+        from jetson_backends import FakeGPIO
+        GPIO = FakeGPIO()
+    else:
+        import Jetson.GPIO as GPIO
+
+def init_cameras():
+    global cameras, ALL_GPIO
+    if GPIO is None: init_gpio()
+    cameras = load_cameras()
+    ALL_GPIO = [pin for camera in cameras for pin in camera.pins]
+    GPIO.setwarnings(False); GPIO.setmode(GPIO.BOARD)
+    for pin in ALL_GPIO: GPIO.setup(pin, GPIO.OUT); GPIO.output(pin, GPIO.LOW)
+
+def start_workers():
+    workers = [threading.Thread(target=inference_thread, daemon=True)]
+    for camera in cameras: workers += [threading.Thread(target=capture_thread, args=(camera,), daemon=True), threading.Thread(target=record_thread, args=(camera,), daemon=True)]
+    for worker in workers: worker.start()
+    return workers
+
+def load_model():
+    """Import and load the detector selected by FL_DETECTOR (ultralytics/torch are only imported here)."""
+    global model, INFERENCE_KWARGS
+    if DETECTOR_BACKEND == "stub":
+        from jetson_backends import StubDetector
+        model = StubDetector(STUB_LATENCY_MS, class_ids=TARGET_CLASS); INFERENCE_KWARGS = {}
+    else:
+        from ultralytics import YOLO
+        model = YOLO(MODEL_PATH); INFERENCE_KWARGS = {"device": "cpu"} if DETECTOR_BACKEND == "cpu" else {}
+
+def warm_up_model():
+    """Run WARMUP_ITERATIONS inferences on blank frames with each camera's frame size and the live batch size; returns their latencies."""
+    frames = [np.zeros(camera.frame_shape, np.uint8) for camera in cameras] or [np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), np.uint8)]
+    latencies = []
+    for _ in range(WARMUP_ITERATIONS):
+        start_time = time.perf_counter(); model(frames, verbose=False, **INFERENCE_KWARGS)
+        latencies.append(round((time.perf_counter() - start_time) * 1000, 1))
+    return latencies
+
+def run_startup_phase(name, step):
+    startup_state["phase"] = name; started = time.monotonic()
+    result = step()
+    startup_state["phases"][name] = round(time.monotonic() - started, 3)
+    return result
 
-def update_gpio(forklift_in, person_in):
+def startup(workers):
+    """Bring the pipeline up behind the already-listening server: GPIO and cameras, capture/record workers (preview works from here),
+    then model load and warm-up; inference starts once model_ready is set."""
+    try:
+        run_startup_phase("cameras", init_cameras)
+        workers += run_startup_phase("workers", start_workers)
+        run_startup_phase("model_load", load_model)
+        startup_state["warmup_ms"] = run_startup_phase("warmup", warm_up_model)
+        model_ready.set(); startup_state["phase"] = "ready"; startup_state["ready_after_s"] = round(time.monotonic() - PROCESS_STARTED, 3)
+        logging.info(f"Startup complete in {startup_state['ready_after_s']}s: {startup_state['phases']} (warm-up {startup_state['warmup_ms']} ms)")
+    except Exception as e:
+        logging.error(f"Startup failed during {startup_state['phase']}: {e}")
+        startup_state["error"] = f"{startup_state['phase']}: {e}"; startup_state["phase"] = "failed"
+
+def find_camera(command):
+    key = command.get("camera")
+    if not cameras: return None
+    if key is None: return cameras[0]
+    for index, camera in enumerate(cameras):
+        if key == camera.name or key == index: return camera
+    return None
+
+def pipeline_stats():
+    return {"fps": {"inference": round(inference_meter.fps, 1)}, "cameras": {camera.name: camera.stats() for camera in cameras}}
+
+def metrics_snapshot():
+    return {
+        "latency_ms": {stage: tracker.summary() for stage, tracker in latency.items()},
+        "fps": {"inference": round(inference_meter.fps, 1), **{f"{camera.name}.{stage}": round(meter.fps, 1) for camera in cameras for stage, meter in camera.meters.items()}},
+        "inference_skipped": {camera.name: camera.scheduler.skipped for camera in cameras},
+        "dropped": {"stream": stream_skipped, "events": events.dropped, **{f"{camera.name}.{queue}": count for camera in cameras for queue, count in (("capture", camera.capture_queue.dropped), ("record", camera.record_queue.dropped))}},
+    }
+
+def metrics_prometheus():
+    metrics = metrics_snapshot(); lines = ["# TYPE jetson_stage_latency_ms summary"]
+    for stage, summary in metrics["latency_ms"].items():
+        for q in ("p50", "p95", "p99"):
+            if summary[q] is not None: lines.append(f'jetson_stage_latency_ms{{stage="{stage}",quantile="0.{q[1:]}"}} {summary[q]}')
+        lines.append(f'jetson_stage_latency_ms_count{{stage="{stage}"}} {summary["count"]}')
+    lines.append("# TYPE jetson_fps gauge")
+    lines += [f'jetson_fps{{stage="{stage}"}} {fps}' for stage, fps in metrics["fps"].items()]
+    lines.append("# TYPE jetson_frames_dropped_total counter")
+    lines += [f'jetson_frames_dropped_total{{queue="{queue}"}} {count}' for queue, count in metrics["dropped"].items()]
+    return "\n".join(lines) + "\n"
+
+def update_gpio(camera, forklift_in, person_in, counts=None):
+    state = "both" if forklift_in and person_in else "forklift" if forklift_in else "person" if person_in else "clear"
     with gpio_lock:
-        if forklift_in and person_in: GPIO.output(BOTH_GPIO, GPIO.HIGH); GPIO.output(FORKLIFT_GPIO, GPIO.LOW); GPIO.output(PERSON_GPIO, GPIO.LOW)
-        elif forklift_in: GPIO.output(BOTH_GPIO, GPIO.LOW); GPIO.output(FORKLIFT_GPIO, GPIO.HIGH); GPIO.output(PERSON_GPIO, GPIO.LOW)
-        elif person_in: GPIO.output(BOTH_GPIO, GPIO.LOW); GPIO.output(FORKLIFT_GPIO, GPIO.LOW); GPIO.output(PERSON_GPIO, GPIO.HIGH)
+        if forklift_in and person_in: GPIO.output(camera.both_gpio, GPIO.HIGH); GPIO.output(camera.forklift_gpio, GPIO.LOW); GPIO.output(camera.person_gpio, GPIO.LOW)
+        elif forklift_in: GPIO.output(camera.both_gpio, GPIO.LOW); GPIO.output(camera.forklift_gpio, GPIO.HIGH); GPIO.output(camera.person_gpio, GPIO.LOW)
+        elif person_in: GPIO.output(camera.both_gpio, GPIO.LOW); GPIO.output(camera.forklift_gpio, GPIO.LOW); GPIO.output(camera.person_gpio, GPIO.HIGH)
         else:
-            for pin in ALL_GPIO: GPIO.output(pin, GPIO.LOW)
+            for pin in camera.pins: GPIO.output(pin, GPIO.LOW)
+    # GPIO 출력이 바뀌는 순간 구독 중인 관제 PC에 바로 알림
+    if state != camera.alarm_state:
+        camera.alarm_state = state; events.publish("alarm", camera, state=state, counts=counts)
 
-def process_frame(frame):
-    global recording, recording_stop_time, video_writer
+def process_batch(batch):
+    """Run one batched model call over the freshest frame of each camera and apply each result to its own camera."""
+    # 게시·녹화 큐에 넘기기 전까지는 추론 스레드만 버퍼를 보유하므로 복사 없이 그 위에 바로 오버레이를 그림
+    frames = [raw_frame for _, raw_frame, _ in batch]
     start_time = time.perf_counter()
-    results = model(frame, verbose=False)[0]
+    results = model(frames, verbose=False, **INFERENCE_KWARGS)
     latency_ms = (time.perf_counter() - start_time) * 1000
-    logging.info(f"Model Inference Latency: {latency_ms:.2f} ms")
-    forklift_in, person_in = False, False
-    if results.boxes is not None:
-        for box in results.boxes:
-            cls_id = int(box.cls[0]); class_name = CLASS_NAME[cls_id]
-            if class_name not in TARGET_CLASS: continue
-            if class_name == 'forklift': forklift_in = True
-            elif class_name == 'person': person_in = True
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            color = (0, 255, 0) if class_name == 'person' else (0, 165, 255)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
-            cv2.putText(frame, class_name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-    update_gpio(forklift_in, person_in)
-    is_danger = GPIO.input(BOTH_GPIO) == GPIO.HIGH
-    if is_danger:
-        if not recording:
-            now = datetime.now().strftime("%Y_%m_%d_%H_%M_%S"); save_path = os.path.join(SAVE_DIR, f"{now}.mp4")
-            fourcc = cv2.VideoWriter_fourcc(*'avc1'); video_writer = cv2.VideoWriter(save_path, fourcc, 15, (frame.shape[1], frame.shape[0]))
-            recording = True; recording_stop_time = 0; logging.info(f"Recording started: {save_path}")
-        if video_writer: video_writer.write(frame)
-    elif recording:
-        if recording_stop_time == 0: recording_stop_time = time.time() + POST_RECORD_BUFFER_SECONDS
-        if time.time() < recording_stop_time:
-            if video_writer: video_writer.write(frame)
-        else:
-            if video_writer: video_writer.release(); video_writer = None
-            recording = False; recording_stop_time = 0; logging.info("Recording finished.")
+    latency["inference"].observe(latency_ms)
+    logging.debug(f"Model Inference Latency: {latency_ms:.2f} ms (batch of {len(frames)})")
+    for (camera, _, captured_at), frame, result in zip(batch, frames, results):
+        process_frame(camera, frame, result, captured_at)
+    return frames
+
+def filter_detections(camera, results, shape):
+    """Copy all boxes to host once, then apply per-class confidence and danger-zone tests in NumPy; returns (xyxy, cls, in_zone)."""
+    boxes = results.boxes
+    if boxes is None or len(boxes) == 0: return np.empty((0, 4), np.int32), np.empty(0, np.intp), np.empty(0, bool)
+    data = boxes.data; data = data.cpu().numpy() if hasattr(data, "cpu") else np.asarray(data)
+    cls = data[:, 5].astype(np.intp); conf = data[:, 4]
+    keep = (cls >= 0) & (cls < len(CLASS_NAME))
+    keep[keep] = conf[keep] >= camera.conf_thresholds[cls[keep]]
+    cls = cls[keep]; xyxy = data[keep, :4].astype(np.int32)
+    mask = camera.zone_mask_for(shape)
+    if mask is None: return xyxy, cls, np.ones(len(cls), bool)
+    # 박스 하단 중앙(발/바퀴 위치)이 구역 안에 있는지로 판정
+    anchor_x = np.clip((xyxy[:, 0] + xyxy[:, 2]) // 2, 0, shape[1] - 1); anchor_y = np.clip(xyxy[:, 3], 0, shape[0] - 1)
+    return xyxy, cls, mask[anchor_y, anchor_x] > 0
+
+def process_frame(camera, frame, results, captured_at):
+    start_time = time.perf_counter()
+    xyxy, cls, in_zone = filter_detections(camera, results, frame.shape)
+    camera.scheduler.note_detection(len(cls) > 0)
+    counts = {class_name: int(np.count_nonzero(in_zone & (cls == cls_id))) for class_name, cls_id in TARGET_CLASS.items()}
+    forklift_in = camera.alarm_filters['forklift'].update(counts['forklift'] > 0)
+    person_in = camera.alarm_filters['person'].update(counts['person'] > 0)
+    if camera.zones: cv2.polylines(frame, camera.zones, True, (0, 0, 255), 1)
+    for (x1, y1, x2, y2), cls_id, inside in zip(xyxy.tolist(), cls.tolist(), in_zone.tolist()):
+        class_name = CLASS_NAME[cls_id]
+        color = (0, 255, 0) if class_name == 'person' else (0, 165, 255)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2 if inside else 1)
+        cv2.putText(frame, class_name, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2 if inside else 1)
+    gpio_start = time.perf_counter(); latency["draw"].observe((gpio_start - start_time) * 1000)
+    update_gpio(camera, forklift_in, person_in, counts)
+    if counts != camera.event_counts and captured_at - camera.event_counts_at >= EVENT_COUNTS_INTERVAL:
+        camera.event_counts = counts; camera.event_counts_at = captured_at; events.publish("detections", camera, counts=counts)
+    is_danger = GPIO.input(camera.both_gpio) == GPIO.HIGH
+    latency["gpio"].observe((time.perf_counter() - gpio_start) * 1000); latency["capture_to_gpio"].observe((time.time() - captured_at) * 1000)
+    # 녹화는 별도 스레드에서 처리하므로 느린 디스크가 GPIO 경보 경로를 지연시키지 않음
+    camera.record(frame, is_danger, captured_at, counts)
     return frame
 
-def camera_thread():
-    global latest_frame, video_writer, recording, tracking_active, terminate
-    cap = cv2.VideoCapture(CAMERA_ID)
-    if not cap.isOpened(): logging.error("Camera open failed!"); terminate = True; return
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH); cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
-    
+def hold_frame(camera, frame, captured_at):
+    """Pass a frame the scheduler skipped to the recorder, keeping the current alarm state."""
+    is_danger = GPIO.input(camera.both_gpio) == GPIO.HIGH
+    camera.record(frame, is_danger, captured_at, {class_name: 0 for class_name in TARGET_CLASS})
+
+def open_capture(camera):
+    """Open the camera's capture backend; GStreamer falls back to V4L2 and then OpenCV's default. Returns (cap, kind)."""
+    source, backend = camera.source, camera.backend
+    if backend == "auto":
+        if source == "synthetic": backend = "synthetic"
+        elif isinstance(source, str) and "!" in source: backend = "gstreamer"
+        elif isinstance(source, str) and os.path.isfile(source): backend = "file"
+        else: backend = "v4l2"
+    if backend == "file": return cv2.VideoCapture(source), "file"
+    if backend == "synthetic":
+        from jetson_backends import SyntheticCapture
+        return SyntheticCapture(FRAME_WIDTH, FRAME_HEIGHT), "synthetic"
+    attempts = []
+    if backend == "gstreamer":
+        pipeline = source if isinstance(source, str) else GSTREAMER_CSI_PIPELINE.format(sensor_id=source, width=FRAME_WIDTH, height=FRAME_HEIGHT)
+        attempts.append(("gstreamer", lambda: cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER)))
+    if not isinstance(source, str) or "!" not in source:
+        attempts += [("v4l2", lambda: cv2.VideoCapture(source, cv2.CAP_V4L2)), ("default", lambda: cv2.VideoCapture(source))]
+    for name, opener in attempts:
+        cap = opener()
+        if cap.isOpened():
+            logging.info(f"Camera {camera.name} opened with {name} backend")
+            cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH); cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT); cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            return cap, "device"
+        cap.release(); logging.warning(f"Camera {camera.name}: {name} backend unavailable")
+    return cv2.VideoCapture(), "device"
+
+def open_capture_with_retry(camera):
+    """Open the camera, marking it failed and retrying with exponential backoff until it opens or the server stops."""
+    retry_delay = CAMERA_RETRY_SECONDS
+    while not terminate:
+        cap, kind = open_capture(camera)
+        if cap.isOpened(): camera.failed = False; return cap, kind
+        cap.release(); camera.failed = True; camera.open_failures += 1
+        logging.error(f"Camera {camera.name} open failed (attempt {camera.open_failures}), retrying in {retry_delay}s")
+        retry_at = time.monotonic() + retry_delay
+        while not terminate and time.monotonic() < retry_at: time.sleep(0.2)
+        retry_delay = min(retry_delay * 2, CAMERA_RETRY_MAX_SECONDS)
+    return None, None
+
+def capture_thread(camera):
+    while not terminate:
+        cap, kind = open_capture_with_retry(camera); is_file = kind == "file"
+        if cap is None: break
+        if camera.open_failures: logging.info(f"Camera {camera.name} opened after {camera.open_failures} failed attempts")
+        # 파일/합성 입력은 원래 FPS로 재생하고 파일이 끝나면 처음부터 반복 (카메라 없이 테스트용)
+        frame_interval = 1.0 / (cap.get(cv2.CAP_PROP_FPS) or 30) if kind != "device" and camera.realtime else 0.0; next_frame_at = time.monotonic()
+        read_failures = 0
+
+        while not terminate and read_failures < CAMERA_MAX_READ_FAILURES:
+            try:
+                buffer = camera.frame_pool.acquire(camera.frame_shape)
+                read_start = time.perf_counter(); ret, raw_frame = cap.read(buffer)
+                latency["capture"].observe((time.perf_counter() - read_start) * 1000)
+                if not ret: camera.frame_pool.release(buffer); read_failures += 1
+                if not ret and is_file: cap.set(cv2.CAP_PROP_POS_FRAMES, 0); continue
+                if not ret: logging.warning(f"Failed to grab frame from {camera.name} ({read_failures}/{CAMERA_MAX_READ_FAILURES})."); time.sleep(0.1); continue
+                read_failures = 0
+                if raw_frame is not buffer: camera.frame_shape = raw_frame.shape; camera.frame_pool.adopt(buffer, raw_frame)
+                if frame_interval:
+                    next_frame_at += frame_interval; delay = next_frame_at - time.monotonic()
+                    if delay > 0: time.sleep(delay)
+                    else: next_frame_at = time.monotonic()
+                camera.capture_queue.put((raw_frame, time.time()))
+                with capture_ready: capture_ready.notify()
+                camera.meters['capture'].tick()
+            except Exception as e:
+                logging.error(f"Exception in {camera.name} capture loop: {e}"); read_failures += 1; time.sleep(1)
+
+        cap.release()
+        if read_failures >= CAMERA_MAX_READ_FAILURES:
+            # 배치 수집이 죽은 카메라를 기다리지 않도록 failed로 표시하고 재연결 시도
+            camera.failed = True; logging.error(f"Camera {camera.name} stopped delivering frames, reopening")
+    logging.info(f"Capture thread for {camera.name} terminated.")
+
+def collect_batch():
+    """Take the freshest frame from each camera, waiting at most BATCH_DEADLINE_MS after the first one arrives."""
+    batch = {}; deadline = None
+    with capture_ready:
+        while not terminate:
+            # 열지 못한 카메라는 기다리지 않음
+            live = [camera for camera in cameras if not camera.failed]
+            for camera in live:
+                if camera.name in batch: continue
+                item = camera.capture_queue.get(timeout=0)
+                if item is not None: batch[camera.name] = (camera, *item)
+            if live and len(batch) >= len(live): break
+            now = time.monotonic()
+            if batch and deadline is None: deadline = now + BATCH_DEADLINE_MS / 1000
+            if deadline is not None and now >= deadline: break
+            capture_ready.wait(deadline - now if deadline is not None else 0.5)
+    return list(batch.values())
+
+def inference_thread():
+    while not terminate:
+        try:
+            batch = collect_batch()
+            if not batch: continue
+
+            # 모델 로드/워밍업이 끝나기 전에는 추론 없이 원본 프레임만 게시
+            with state_lock: is_tracking = tracking_active and model_ready.is_set()
+
+            # 캡처에서 받은 참조는 게시/녹화 큐가 각자 retain한 뒤 여기서 반환
+            try:
+                frames_to_be_sent = [raw_frame for _, raw_frame, _ in batch]
+                if is_tracking:
+                    gated = [camera.scheduler.should_infer(raw_frame) for camera, raw_frame, _ in batch]
+                    inferred = iter(process_batch([item for item, run in zip(batch, gated) if run]) if any(gated) else ())
+                    for i, ((camera, raw_frame, captured_at), run) in enumerate(zip(batch, gated)):
+                        if run: frames_to_be_sent[i] = next(inferred)
+                        else: hold_frame(camera, raw_frame, captured_at)
+
+                for (camera, _, _), frame in zip(batch, frames_to_be_sent): camera.publish(frame)
+            finally:
+                for camera, raw_frame, _ in batch: camera.frame_pool.release(raw_frame)
+            inference_meter.tick()
+        except Exception as e:
+            logging.error(f"Exception in inference loop: {e}"); time.sleep(1)
+    logging.info("Inference thread terminated.")
+
+def finish_clip(camera, video_writer, clip):
+    video_writer.release()
+    # 프레임 수가 아닌 캡처 시각으로 계산 (프리롤로 당겨진 start부터 마지막으로 쓴 프레임까지)
+    duration = round(clip["end"] - clip["start"], 1)
+    try: camera.recording_index.add(clip["filename"], clip["start"], duration, clip["detections"])
+    except Exception as e: logging.error(f"Failed to index recording {clip['filename']}: {e}")
+    events.publish("recording_finished", camera, filename=clip["filename"], duration=duration, detections=clip["detections"])
+
+def record_thread(camera):
+    recording = False; recording_stop_time = 0; video_writer = None; clip = None; open_retry_at = 0; next_record_at = 0
     while not terminate:
+        item = camera.record_queue.get(timeout=0.5)
+        if item is None: continue
+        frame, is_danger, captured_at, counts = item
         try:
-            ret, raw_frame = cap.read()
-            if not ret: logging.warning("Failed to grab frame."); time.sleep(0.1); continue
-            
-            with state_lock: is_tracking = tracking_active
-            
-            frame_to_be_sent = raw_frame
-            if is_tracking:
-                frame_to_be_sent = process_frame(raw_frame.copy())
-            
-            with frame_lock:
-                latest_frame = frame_to_be_sent
-            
-            time.sleep(0.01)
+            if is_danger:
+                if not recording and captured_at >= open_retry_at:
+                    now = datetime.fromtimestamp(captured_at).strftime("%Y_%m_%d_%H_%M_%S"); save_path = os.path.join(camera.save_dir, f"{now}.mp4")
+                    fourcc = cv2.VideoWriter_fourcc(*RECORD_FOURCC); video_writer = cv2.VideoWriter(save_path, fourcc, RECORD_FPS, (frame.shape[1], frame.shape[0]))
+                if not recording and video_writer is not None and not video_writer.isOpened():
+                    # 코덱을 열 수 없으면 클립을 만들지 않고 프리롤을 유지한 채 잠시 후 다시 시도
+                    video_writer.release(); video_writer = None; camera.record_open_failures += 1; open_retry_at = captured_at + RECORD_OPEN_RETRY_SECONDS
+                    if os.path.isfile(save_path) and os.path.getsize(save_path) == 0: os.remove(save_path)
+                    logging.error(f"Recording {camera.name}: cannot open VideoWriter for {save_path} with fourcc '{RECORD_FOURCC}', retrying in {RECORD_OPEN_RETRY_SECONDS}s")
+                elif not recording and video_writer is not None:
+                    recording = True; logging.info(f"Recording started: {save_path} ({camera.pre_roll.stats()['seconds']}s pre-roll)")
+                    clip = {"filename": os.path.basename(save_path), "start": captured_at, "end": captured_at, "frames": 0, "detections": {name: 0 for name in TARGET_CLASS}}
+                    events.publish("recording_started", camera, filename=clip["filename"], pre_roll_seconds=camera.pre_roll.stats()['seconds'])
+                    # 이벤트 직전 상황을 클립 앞부분에 포함
+                    for buffered_at, buffered in camera.pre_roll.drain():
+                        video_writer.write(buffered); clip["frames"] += 1; clip["start"] = min(clip["start"], buffered_at)
+                recording_stop_time = 0
+            elif recording:
+                if recording_stop_time == 0: recording_stop_time = captured_at + POST_RECORD_BUFFER_SECONDS
+                if captured_at >= recording_stop_time:
+                    finish_clip(camera, video_writer, clip); video_writer = None; clip = None
+                    recording = False; recording_stop_time = 0; logging.info(f"Recording finished ({camera.name}).")
+            # 큐에는 카메라 속도(건너뛴 추론 프레임 포함)로 들어오므로 RECORD_FPS 간격으로 솎아야 클립이 실제 속도로 재생됨
+            keep = captured_at >= next_record_at
+            if keep: next_record_at = next_record_at + 1 / RECORD_FPS if captured_at - next_record_at < 1 / RECORD_FPS else captured_at + 1 / RECORD_FPS
+            if recording:
+                for name, count in counts.items(): clip["detections"][name] += count
+                if keep:
+                    write_start = time.perf_counter(); video_writer.write(frame); clip["frames"] += 1; clip["end"] = captured_at
+                    latency["record_write"].observe((time.perf_counter() - write_start) * 1000)
+            elif keep: camera.pre_roll.push(frame, captured_at)
+            camera.meters['record'].tick()
         except Exception as e:
-            logging.error(f"Exception in camera loop: {e}"); time.sleep(1)
-            
+            logging.error(f"Exception in record loop: {e}")
+        finally: camera.frame_pool.release(frame)
+
     if recording and video_writer:
-        video_writer.release()
+        finish_clip(camera, video_writer, clip)
         logging.info("Recording file has been saved safely on exit.")
-            
-    cap.release()
-    with gpio_lock: GPIO.cleanup()
-    logging.info("Camera thread terminated.")
+    logging.info(f"Record thread for {camera.name} terminated.")
+
 
+async def stream_frames(writer, addr, camera, size, fps, quality, max_kbps):
+    """Push length-prefixed raw JPEG frames to a subscribed client until it disconnects, skipping frames it cannot keep up with
+    and adapting quality/resolution to its bandwidth budget and measured send time."""
+    global stream_skipped
+    logging.info(f"Streaming {camera.name} to {addr}: {size[0]}x{size[1]} @ {fps} fps, quality {quality}, budget {max_kbps or 'unlimited'} kbps")
+    loop = asyncio.get_running_loop(); transport = writer.transport
+    transport.set_write_buffer_limits(high=STREAM_WRITE_BUFFER)
+    sock = transport.get_extra_info("socket")
+    if sock is not None: sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, STREAM_SOCKET_SNDBUF)
+    adapter = StreamAdapter(size, quality, fps, max_kbps)
+    interval = 1.0 / fps; last_seq = 0; skipped = 0; frame_bytes = 0
+    while not terminate and not transport.is_closing():
+        started = loop.time()
+        _, seq = camera.snapshot()
+        if seq != last_seq:
+            # 느린 클라이언트는 프레임을 쌓지 않고 건너뜀 (클라이언트별 backpressure); 2프레임 이상 밀리면 지연이 커지므로 최신 프레임만 보냄
+            buffered = transport.get_write_buffer_size()
+            if buffered > STREAM_WRITE_BUFFER or (frame_bytes and buffered > 2 * frame_bytes): skipped += 1; stream_skipped += 1
+            else:
+                seq, jpeg = await loop.run_in_executor(encode_pool, camera.preview_cache.get, adapter.size, adapter.quality)
+                if jpeg is not None:
+                    last_seq = seq; frame_bytes = STREAM_HEADER.size + len(jpeg)
+                    writer.write(STREAM_HEADER.pack(len(jpeg)) + jpeg); adapter.sent(frame_bytes, loop.time()); await writer.drain()
+            adapter.update(frame_bytes, transport.get_write_buffer_size(), loop.time())
+        await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+    logging.info(f"Stream to {addr} ended ({skipped} frames skipped for backpressure, {adapter.changes} quality changes, "
+                 f"last {adapter.size[0]}x{adapter.size[1]} q{adapter.quality})")
 
-def handle_client(conn, addr):
+async def stream_events(writer, addr):
+    """Push events as JSON lines until the client disconnects; an idle link gets a heartbeat so dead peers are noticed."""
+    queue = events.subscribe(); logging.info(f"Event subscriber {addr} ({len(events.subscribers)} total)")
+    try:
+        while not terminate and not writer.transport.is_closing():
+            try: event = await asyncio.wait_for(queue.get(), EVENT_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError: event = {"type": "event", "event": "heartbeat", "time": round(time.time(), 3)}
+            writer.write((json.dumps(event) + "\n").encode()); await writer.drain()
+    finally:
+        events.unsubscribe(queue); logging.info(f"Event subscriber {addr} left")
+
+async def send_recording(writer, addr, path, offset, chunk_size):
+    """Send a file as (offset, length, crc32)-prefixed chunks starting at offset; a zero-length chunk marks the end."""
+    logging.info(f"Sending {os.path.basename(path)} to {addr} from offset {offset}")
+    loop = asyncio.get_running_loop()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while not terminate:
+            data = await loop.run_in_executor(encode_pool, f.read, chunk_size)
+            if not data: break
+            writer.write(CHUNK_HEADER.pack(offset, len(data), zlib.crc32(data))); writer.write(data)
+            await writer.drain(); offset += len(data)
+    writer.write(CHUNK_HEADER.pack(offset, 0, 0)); await writer.drain()
+    logging.info(f"Finished sending {os.path.basename(path)} to {addr}")
+
+async def handle_command(command):
+    """Execute one JSON command; returns (response, stream_params, download_params, subscribe_events)."""
     global tracking_active
+    command_type = command.get("type"); response = {}; stream_params = None; download_params = None; subscribe_events = False
+    camera = find_camera(command)
+    if camera is None and (command.get("camera") is not None or command_type in CAMERA_COMMANDS):
+        response = {"status": "error", "message": f"Unknown camera: {command.get('camera')}" if cameras else "Cameras not initialized yet"}
+    elif command_type == "start_tracking":
+        with state_lock: tracking_active = True
+        response = {"status": "success", "ready": model_ready.is_set()}
+    elif command_type == "stop_tracking":
+        with state_lock: tracking_active = False
+        for each in cameras: each.reset_alarms(); update_gpio(each, False, False)
+        response = {"status": "success"}
+    elif command_type == "status":
+        with state_lock: is_tracking = tracking_active
+        response = {"status": "success", "tracking_status": is_tracking, "ready": model_ready.is_set(), "cameras": [each.name for each in cameras], "pipeline": pipeline_stats(),
+                    # 시작 스레드가 phases에 계속 추가하므로 중첩 dict도 복사해 직렬화 중 변경되지 않게 함
+                    "startup": {**startup_state, "phases": dict(startup_state["phases"]), "uptime_s": round(time.monotonic() - PROCESS_STARTED, 1)}}
+    elif command_type == "metrics":
+        response = {"status": "success", **metrics_snapshot()}
+    elif command_type == "get_frame":
+        width = max(16, min(int(command.get("width", PREVIEW_DEFAULT_SIZE[0])), FRAME_WIDTH)); height = max(16, min(int(command.get("height", PREVIEW_DEFAULT_SIZE[1])), FRAME_HEIGHT))
+        quality = max(10, min(int(command.get("quality", PREVIEW_DEFAULT_QUALITY)), 95))
+        frame, current_seq = camera.snapshot()
+        if frame is None: current_seq = None
+        if current_seq is not None and command.get("version") == current_seq:
+            response = {"status": "not_modified", "version": current_seq}
+        else:
+            seq, jpeg = await asyncio.get_running_loop().run_in_executor(encode_pool, camera.preview_cache.get, (width, height), quality)
+            if jpeg is not None: response = {"status": "success", "frame": base64.b64encode(jpeg).decode('ascii'), "version": seq}
+            else: response = {"status": "error", "message": "No frame"}
+    elif command_type == "subscribe_stream":
+        width = max(16, min(int(command.get("width", 200)), FRAME_WIDTH)); height = max(16, min(int(command.get("height", 150)), FRAME_HEIGHT))
+        fps = max(1, min(int(command.get("fps", 10)), STREAM_MAX_FPS)); quality = max(10, min(int(command.get("quality", STREAM_DEFAULT_QUALITY)), 95))
+        max_kbps = max(0, min(int(command.get("max_kbps", STREAM_DEFAULT_KBPS)), STREAM_MAX_KBPS))
+        stream_params = (camera, (width, height), fps, quality, max_kbps)
+        response = {"status": "success", "width": width, "height": height, "fps": fps, "quality": quality, "max_kbps": max_kbps, "adaptive": True, "header": "uint32-be"}
+    elif command_type == "subscribe_events":
+        subscribe_events = True
+        response = {"status": "success", "format": "json-lines", "alarms": {each.name: each.alarm_state for each in cameras}, "heartbeat": EVENT_HEARTBEAT_SECONDS}
+    elif command_type == "list_recordings":
+        try:
+            offset = max(0, int(command.get("offset", 0))); limit = command.get("limit")
+            recordings, total, total_bytes = camera.recording_index.query(offset, int(limit) if limit is not None else None, command.get("since"), command.get("until"))
+            response = {"status": "success", "files": [entry["filename"] for entry in recordings], "recordings": recordings,
+                        "total": total, "offset": offset, "total_mb": round(total_bytes / (1024 * 1024), 1)}
+        except Exception as e: response = {"status": "error", "message": str(e)}
+    elif command_type == "download_recording":
+        filename = os.path.basename(str(command.get("filename", ""))); path = os.path.join(camera.save_dir, filename)
+        if not filename.endswith(".mp4") or not os.path.isfile(path): response = {"status": "error", "message": f"No such recording: {filename}"}
+        else:
+            size = os.path.getsize(path); offset = max(0, min(int(command.get("offset", 0)), size))
+            chunk_size = max(4096, min(int(command.get("chunk_size", DOWNLOAD_CHUNK_SIZE)), DOWNLOAD_MAX_CHUNK_SIZE))
+            download_params = (path, offset, chunk_size)
+            response = {"status": "success", "filename": filename, "size": size, "offset": offset, "chunk_size": chunk_size, "header": "uint64 offset, uint32 length, uint32 crc32 (big-endian)"}
+    else:
+        response = {"status": "error", "message": "Unknown command"}
+    return response, stream_params, download_params, subscribe_events
+
+async def send_reply(writer, write_lock, command):
+    """Run a command tagged with request_id concurrently with the rest of the connection and reply with the id echoed."""
+    try: response = (await handle_command(command))[0]
+    except Exception as e: response = {"status": "error", "message": str(e)}
+    response["request_id"] = command["request_id"]
+    async with write_lock: writer.write((json.dumps(response) + "\n").encode()); await writer.drain()
+
+async def handle_client(reader, writer):
+    addr = writer.get_extra_info("peername")
     logging.info(f"Client connected: {addr}")
+    write_lock = asyncio.Lock(); in_flight = set()
     try:
-        with conn:
-            buffer = b""
-            while not terminate:
-                data = conn.recv(1024)
-                if not data: break
-                buffer += data
-                while b"\n" in buffer:
-                    line, buffer = buffer.split(b"\n", 1)
-                    command = json.loads(line.decode())
-                    command_type = command.get("type"); response = {}
-                    if command_type == "start_tracking":
-                        with state_lock: tracking_active = True
-                        response = {"status": "success"}
-                    elif command_type == "stop_tracking":
-                        with state_lock: tracking_active = False
-                        update_gpio(False, False)
-                        response = {"status": "success"}
-                    elif command_type == "status":
-                        with state_lock: is_tracking = tracking_active
-                        response = {"status": "success", "tracking_status": is_tracking}
-                    elif command_type == "get_frame":
-                        with frame_lock:
-                            if latest_frame is not None:
-                                small_frame = cv2.resize(latest_frame, (200, 150))
-                                _, img_encoded = cv2.imencode(".jpg", small_frame)
-                                img_bytes = base64.b64encode(img_encoded).decode('ascii')
-                                response = {"status": "success", "frame": img_bytes}
-                            else: response = {"status": "error", "message": "No frame"}
-                    elif command_type == "list_recordings":
-                        try:
-                            files = sorted([f for f in os.listdir(SAVE_DIR) if f.endswith('.mp4')], reverse=True)
-                            response = {"status": "success", "files": files}
-                        except Exception as e: response = {"status": "error", "message": str(e)}
-                    else:
-                        response = {"status": "error", "message": "Unknown command"}
-                    
-                    conn.sendall((json.dumps(response) + "\n").encode())
-    except (ConnectionResetError, BrokenPipeError):
+        while not terminate:
+            line = await reader.readline()
+            if not line: break
+            command = json.loads(line.decode())
+            if "request_id" in command and command.get("type") not in PUSH_COMMANDS:
+                # request_id가 있으면 느린 명령 뒤에 줄 서지 않도록 동시에 처리하고 완료 순서대로 응답
+                task = asyncio.ensure_future(send_reply(writer, write_lock, command)); in_flight.add(task); task.add_done_callback(in_flight.discard)
+                continue
+            response, stream_params, download_params, subscribe_events = await handle_command(command)
+            if "request_id" in command: response["request_id"] = command["request_id"]
+            async with write_lock: writer.write((json.dumps(response) + "\n").encode()); await writer.drain()
+            # 구독/다운로드 이후 이 연결은 푸시 전용이 됨 (명령은 별도 연결로)
+            if stream_params: await stream_frames(writer, addr, *stream_params); break
+            if download_params: await send_recording(writer, addr, *download_params); break
+            if subscribe_events: await stream_events(writer, addr); break
+    except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError):
         logging.warning(f"Client {addr} disconnected unexpectedly.")
     except Exception as e:
         logging.error(f"Error with client {addr}: {e}")
     finally:
+        for task in in_flight: task.cancel()
+        writer.close()
         logging.info(f"Connection from {addr} closed.")
 
-def start_server():
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind(("", PORT))
-        s.listen(128)
-        logging.info(f"Threaded server listening on port {PORT}")
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            while not terminate:
-                try:
-                    s.settimeout(1.0)
-                    conn, addr = s.accept()
-                    executor.submit(handle_client, conn, addr)
-                except socket.timeout: continue
-                except Exception as e:
-                    if not terminate: logging.error(f"Server accept error: {e}")
+async def handle_metrics_http(reader, writer):
+    """Minimal HTTP endpoint serving metrics_prometheus() for Prometheus scrapes."""
+    try:
+        await reader.readuntil(b"\r\n\r\n")
+        body = metrics_prometheus().encode()
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: " + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError): pass
+    finally: writer.close()
+
+async def serve():
+    events.bind(asyncio.get_running_loop())
+    server = await asyncio.start_server(handle_client, host="", port=PORT, reuse_address=True, backlog=128)
+    startup_state["listening_after_s"] = round(time.monotonic() - PROCESS_STARTED, 3)
+    logging.info(f"Asyncio server listening on port {PORT} ({startup_state['listening_after_s']}s after start)")
+    metrics_server = None
+    if METRICS_HTTP_PORT:
+        # 메트릭 포트를 쓸 수 없어도 명령 서버와 GPIO 경보는 계속 동작해야 함
+        try:
+            metrics_server = await asyncio.start_server(handle_metrics_http, host="", port=METRICS_HTTP_PORT, reuse_address=True)
+            logging.info(f"Prometheus metrics on http://0.0.0.0:{METRICS_HTTP_PORT}/metrics")
+        except OSError as e: logging.warning(f"Prometheus metrics endpoint disabled, cannot listen on port {METRICS_HTTP_PORT}: {e}")
+    async with server:
+        while not terminate: await asyncio.sleep(0.5)
+    if metrics_server: metrics_server.close()
     logging.info("Server shutdown.")
 
+def start_server():
+    asyncio.run(serve())
+    encode_pool.shutdown(wait=False)
+
 def signal_handler(sig, frame):
     global terminate
     if not terminate: logging.info("Shutdown signal received..."); terminate = True
 
 if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler); signal.signal(signal.SIGTERM, signal_handler)
-    threading.Thread(target=camera_thread, daemon=True).start()
+    startup_state["phases"]["imports"] = round(time.monotonic() - PROCESS_STARTED, 3)
+    # 서버를 먼저 띄우고 카메라·모델 준비는 백그라운드에서 진행 (status의 ready/startup 필드로 확인)
+    workers = []
+    threading.Thread(target=startup, args=(workers,), daemon=True).start()
     start_server()
+    for worker in workers: worker.join(timeout=5)
+    if GPIO is not None:
+        with gpio_lock: GPIO.cleanup()
     logging.info("Application terminated.")
\ No newline at end of file